@@ -0,0 +1,351 @@
+"""Document text extractors that run on the document process pool.
+
+They live outside main.py, which parses arguments, loads the databases and builds
+the app at import time, so a pool worker only needs this module to run its task.
+Keep it free of side effects beyond optional imports.
+"""
+import os
+import posixpath
+import logging
+import threading
+import zipfile
+from io import BytesIO
+from typing import List, Optional, Tuple
+import PyPDF2
+# Prefer PDFium (C++) for PDF text extraction, fall back to pure-Python PyPDF2
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+# Prefer libxml2-backed lxml for the Office XML parts, fall back to the stdlib parser
+try:
+    from lxml import etree as ET
+    LXML_AVAILABLE = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    LXML_AVAILABLE = False
+
+# Document format libraries; each format is rejected or falls back when its library is missing
+try:
+    import docx
+    DOCX_AVAILABLE = True
+except ImportError:
+    DOCX_AVAILABLE = False
+
+try:
+    from pptx import Presentation
+    PPTX_AVAILABLE = True
+except ImportError:
+    PPTX_AVAILABLE = False
+
+try:
+    import openpyxl
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except ImportError:
+    PANDAS_AVAILABLE = False
+
+logger = logging.getLogger("clara-documents")
+
+# Documents with fewer pages/sheets/slides than this are extracted in one go rather than split
+PDF_PARALLEL_MIN_PAGES = 8
+DOCUMENT_PARALLEL_MIN_PARTS = 4
+
+# PDFium isn't thread-safe; PDFs extracted on threads in the parent share this lock
+pdfium_lock = threading.Lock()
+
+def reset_pdfium_lock():
+    """Give forked pool workers a fresh lock in case the parent held it mid-fork"""
+    global pdfium_lock
+    pdfium_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_pdfium_lock)
+
+def read_pdfium_pages(pdf, start: int, end: int) -> str:
+    """Extract text from pages [start, end) of an open PDFium document"""
+    parts = []
+    for i in range(start, end):
+        page = pdf[i]
+        textpage = page.get_textpage()
+        parts.append(textpage.get_text_range() + "\n")
+        textpage.close()
+        page.close()
+    return "".join(parts)
+
+def extract_pdf_page_range(pdf_bytes: bytes, start: int, end: Optional[int] = None) -> str:
+    """Extract text from pages [start, end) of a PDF (runs in a worker process)"""
+    if PDFIUM_AVAILABLE:
+        with pdfium_lock:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+            try:
+                return read_pdfium_pages(pdf, start, len(pdf) if end is None else end)
+            finally:
+                pdf.close()
+    
+    pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+    return "".join(page.extract_text() + "\n" for page in pdf_reader.pages[start:end])
+
+def extract_small_pdf(pdf_bytes: bytes) -> Tuple[int, Optional[str]]:
+    """Open a PDF once and return (page count, text), with text only when it's too small to split"""
+    if PDFIUM_AVAILABLE:
+        with pdfium_lock:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+            try:
+                page_count = len(pdf)
+                if page_count >= PDF_PARALLEL_MIN_PAGES:
+                    return page_count, None
+                return page_count, read_pdfium_pages(pdf, 0, page_count)
+            finally:
+                pdf.close()
+    
+    pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+    page_count = len(pdf_reader.pages)
+    if page_count >= PDF_PARALLEL_MIN_PAGES:
+        return page_count, None
+    return page_count, "".join(page.extract_text() + "\n" for page in pdf_reader.pages)
+
+class XMLTextCollector:
+    """XML parser target that collects text in document order without building a tree"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self._buffer: List[str] = []
+
+    def _flush(self):
+        text = "".join(self._buffer).strip()
+        if text:
+            self.parts.append(text)
+        self._buffer.clear()
+
+    def start(self, tag, attrib):
+        self._flush()
+
+    def end(self, tag):
+        self._flush()
+
+    def data(self, data):
+        self._buffer.append(data)
+
+    def close(self) -> str:
+        self._flush()
+        return "\n".join(self.parts)
+
+WORDPROCESSINGML_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+class DocxTextCollector:
+    """XML parser target that collects the non-empty paragraphs of a DOCX document.xml"""
+
+    def __init__(self):
+        self.paragraphs: List[str] = []
+        self._buffer: List[str] = []
+        self._in_text = False
+
+    def start(self, tag, attrib):
+        if tag == WORDPROCESSINGML_NS + "t":
+            self._in_text = True
+        elif tag == WORDPROCESSINGML_NS + "tab":
+            self._buffer.append("\t")
+        elif tag in (WORDPROCESSINGML_NS + "br", WORDPROCESSINGML_NS + "cr"):
+            self._buffer.append("\n")
+
+    def end(self, tag):
+        if tag == WORDPROCESSINGML_NS + "t":
+            self._in_text = False
+        elif tag == WORDPROCESSINGML_NS + "p":
+            text = "".join(self._buffer).strip()
+            if text:
+                self.paragraphs.append(text)
+            self._buffer.clear()
+
+    def data(self, data):
+        if self._in_text:
+            self._buffer.append(data)
+
+    def close(self) -> str:
+        return "\n\n".join(self.paragraphs)
+
+DRAWINGML_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+PRESENTATIONML_NS = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+PACKAGE_RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+OFFICE_RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+class SlideTextCollector:
+    """XML parser target that collects the non-empty text bodies of a PPTX slide"""
+
+    def __init__(self):
+        self.blocks: List[str] = []
+        self._paragraphs: List[str] = []
+        self._buffer: List[str] = []
+        self._in_text = False
+
+    def start(self, tag, attrib):
+        if tag == DRAWINGML_NS + "t":
+            self._in_text = True
+        elif tag == DRAWINGML_NS + "br":
+            self._buffer.append("\n")
+
+    def end(self, tag):
+        if tag == DRAWINGML_NS + "t":
+            self._in_text = False
+        elif tag == DRAWINGML_NS + "p":
+            self._paragraphs.append("".join(self._buffer))
+            self._buffer.clear()
+        elif tag in (PRESENTATIONML_NS + "txBody", DRAWINGML_NS + "txBody"):
+            text = "\n".join(self._paragraphs)
+            if text.strip():
+                self.blocks.append(text)
+            self._paragraphs.clear()
+
+    def data(self, data):
+        if self._in_text:
+            self._buffer.append(data)
+
+    def close(self) -> str:
+        return "\n".join(self.blocks)
+
+def make_upload_xml_parser(target=None, huge_tree: bool = False):
+    """Build an XML parser for uploaded content that never resolves entities or touches the network"""
+    if LXML_AVAILABLE:
+        # lxml resolves external entities by default before 5.0; uploads must not pull in local files
+        return ET.XMLParser(target=target, resolve_entities=False, no_network=True, huge_tree=huge_tree)
+    # The stdlib parser doesn't fetch external entities
+    return ET.XMLParser(target=target)
+
+def extract_text_from_docx(file_content: bytes) -> str:
+    """Extract non-empty paragraphs from Word document bytes"""
+    # Stream word/document.xml through a parser target rather than building
+    # python-docx Paragraph objects; python-docx remains the fallback
+    try:
+        with zipfile.ZipFile(BytesIO(file_content)) as archive, archive.open('word/document.xml') as document_xml:
+            xml_parser = make_upload_xml_parser(DocxTextCollector())
+            while chunk := document_xml.read(1024 * 1024):
+                xml_parser.feed(chunk)
+            return xml_parser.close()
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        if not DOCX_AVAILABLE:
+            raise
+        logger.warning(f"Falling back to python-docx for Word document: {e}")
+    
+    doc = docx.Document(BytesIO(file_content))
+    return "\n\n".join(text for text in (para.text.strip() for para in doc.paragraphs) if text)
+
+def read_pptx_slide_names(archive: zipfile.ZipFile) -> List[str]:
+    """Return the slide part names of a PPTX archive in presentation order"""
+    with archive.open('ppt/_rels/presentation.xml.rels') as rels_xml:
+        targets = {
+            rel.get('Id'): rel.get('Target')
+            for rel in ET.parse(rels_xml, parser=make_upload_xml_parser()).getroot().iter(PACKAGE_RELATIONSHIPS_NS + 'Relationship')
+        }
+    with archive.open('ppt/presentation.xml') as presentation_xml:
+        slide_ids = ET.parse(presentation_xml, parser=make_upload_xml_parser()).getroot().iter(PRESENTATIONML_NS + 'sldId')
+        rel_ids = [slide_id.get(OFFICE_RELATIONSHIPS_NS + 'id') for slide_id in slide_ids]
+    # Targets are relative to ppt/ unless they are absolute part names
+    return [
+        targets[rel_id].lstrip('/') if targets[rel_id].startswith('/')
+        else posixpath.normpath(posixpath.join('ppt', targets[rel_id]))
+        for rel_id in rel_ids
+    ]
+
+def read_pptx_slide_sections(archive: zipfile.ZipFile, slide_names: List[str], first_number: int) -> List[str]:
+    """Stream each slide's XML through a parser target, one section per slide with text"""
+    slide_sections = []
+    for i, slide_name in enumerate(slide_names, first_number):
+        xml_parser = make_upload_xml_parser(SlideTextCollector())
+        with archive.open(slide_name) as slide_xml:
+            xml_parser.feed(slide_xml.read())
+        text = xml_parser.close()
+        if text:
+            slide_sections.append(f"--- Slide {i} ---\n{text}")
+    return slide_sections
+
+def read_pptx_slide_range(file_content: bytes, start: int, end: Optional[int] = None) -> List[str]:
+    """Extract sections for slides [start, end) of a PPTX (runs in a worker process)"""
+    with zipfile.ZipFile(BytesIO(file_content)) as archive:
+        return read_pptx_slide_sections(archive, read_pptx_slide_names(archive)[start:end], start + 1)
+
+def extract_small_pptx(file_content: bytes) -> Tuple[int, Optional[str]]:
+    """Open a PPTX once and return (slide count, text), with text only when it's too small to split"""
+    # Reading the slide XML directly skips the python-pptx object model;
+    # python-pptx remains the fallback
+    try:
+        with zipfile.ZipFile(BytesIO(file_content)) as archive:
+            slide_names = read_pptx_slide_names(archive)
+            if len(slide_names) >= DOCUMENT_PARALLEL_MIN_PARTS:
+                return len(slide_names), None
+            return len(slide_names), "\n\n".join(read_pptx_slide_sections(archive, slide_names, 1))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        if not PPTX_AVAILABLE:
+            raise
+        logger.warning(f"Falling back to python-pptx for PowerPoint document: {e}")
+    
+    return 0, extract_text_from_pptx(file_content)
+
+def extract_text_from_pptx(file_content: bytes) -> str:
+    """Extract text from PowerPoint bytes with python-pptx, one section per slide with text"""
+    prs = Presentation(BytesIO(file_content))
+    # Everything goes into one flat list with its separators and is joined once
+    parts = []
+    for i, slide in enumerate(prs.slides, 1):
+        header_written = False
+        for shape in slide.shapes:
+            # has_text_frame is a cheap flag; shape.text would be looked up on every shape
+            if not shape.has_text_frame:
+                continue
+            text = shape.text_frame.text
+            if not text.strip():
+                continue
+            if not header_written:
+                if parts:
+                    parts.append("\n\n")
+                parts.append(f"--- Slide {i} ---")
+                header_written = True
+            parts.append("\n")
+            parts.append(text)
+    return "".join(parts)
+
+def read_xlsx_sheets(worksheets) -> List[str]:
+    """Stream rows of read-only worksheets into one section per sheet"""
+    content_parts = []
+    for worksheet in worksheets:
+        rows = ("\t".join("" if cell is None else str(cell) for cell in row)
+                for row in worksheet.iter_rows(values_only=True))
+        content_parts.append(f"Sheet: {worksheet.title}\n" + "\n".join(rows))
+    return content_parts
+
+def open_xlsx_workbook(file_content: bytes):
+    """Open .xlsx bytes in read-only mode instead of building a DataFrame per sheet"""
+    return openpyxl.load_workbook(BytesIO(file_content), read_only=True, data_only=True, keep_links=False)
+
+def read_xlsx_sheet_range(file_content: bytes, start: int, end: Optional[int] = None) -> List[str]:
+    """Extract sections for sheets [start, end) of an .xlsx workbook (runs in a worker process)"""
+    workbook = open_xlsx_workbook(file_content)
+    try:
+        return read_xlsx_sheets(workbook.worksheets[start:end])
+    finally:
+        workbook.close()
+
+def extract_small_excel(file_ext: str, file_content: bytes) -> Tuple[int, Optional[List[str]]]:
+    """Open a workbook once and return (sheet count, sections), with sections only when it's too small to split"""
+    if file_ext == 'xlsx':
+        workbook = open_xlsx_workbook(file_content)
+        try:
+            if len(workbook.worksheets) >= DOCUMENT_PARALLEL_MIN_PARTS:
+                return len(workbook.worksheets), None
+            return len(workbook.worksheets), read_xlsx_sheets(workbook.worksheets)
+        finally:
+            workbook.close()
+    
+    # Legacy .xls needs xlrd via pandas, which reads the whole file anyway; parse every sheet in one pass.
+    # Tab-separated rows match the .xlsx output and skip to_string's column-width formatting
+    content_parts = [
+        f"Sheet: {sheet_name}\n" + df.to_csv(sep='\t', index=False, lineterminator='\n').removesuffix('\n')
+        for sheet_name, df in pd.read_excel(BytesIO(file_content), sheet_name=None).items()
+    ]
+    return len(content_parts), content_parts
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict
+
+logger = logging.getLogger("clara-ingest")
+
+class NotebookIngestQueue:
+    """Background document ingestion, one document at a time per notebook.
+
+    Each notebook has its own FIFO of pending documents, drained by one task
+    while it has work. A global semaphore caps how many documents are processed
+    at once, and is taken per document, so a large upload to one notebook
+    doesn't hold up documents uploaded to another.
+    """
+
+    def __init__(self, process: Callable[[str, str], Awaitable[None]], max_concurrent: int):
+        self.process = process
+        self.max_concurrent = max_concurrent
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._pending: Dict[str, Deque[str]] = {}
+        self._drains: Dict[str, asyncio.Task] = {}
+
+    def put(self, notebook_id: str, document_id: str):
+        """Queue a document, starting a drain task for its notebook if none is running"""
+        self._pending.setdefault(notebook_id, deque()).append(document_id)
+        if notebook_id not in self._drains:
+            self._drains[notebook_id] = asyncio.create_task(self._drain(notebook_id))
+
+    def pending(self, notebook_id: str = None) -> int:
+        """Number of documents waiting to start, for one notebook or overall"""
+        if notebook_id is not None:
+            return len(self._pending.get(notebook_id, ()))
+        return sum(len(documents) for documents in self._pending.values())
+
+    def discard(self, notebook_id: str):
+        """Drop a notebook's documents that haven't started yet"""
+        documents = self._pending.get(notebook_id)
+        if documents:
+            documents.clear()
+
+    def cancel(self):
+        """Cancel every drain task, e.g. at shutdown"""
+        for task in self._drains.values():
+            task.cancel()
+
+    async def _drain(self, notebook_id: str):
+        documents = self._pending[notebook_id]
+        try:
+            while documents:
+                async with self._semaphore:
+                    # Re-check after waiting: the notebook may have been discarded meanwhile
+                    if not documents:
+                        break
+                    document_id = documents.popleft()
+                    try:
+                        await self.process(notebook_id, document_id)
+                    except Exception as e:
+                        logger.error(f"Ingestion failed on document {document_id}: {e}")
+        finally:
+            # No await between the last empty check and here, so put() can't slip in
+            del self._drains[notebook_id]
+            if not documents:
+                del self._pending[notebook_id]
@@ -6,20 +6,76 @@ import traceback
 import time
 import argparse
 import uuid
+import random
+import re
+import copy
+import html
+import string
 import asyncio
+import threading
+import multiprocessing
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, Request, File, UploadFile, Form, Depends, Query, BackgroundTasks
-from fastapi.responses import JSONResponse, Response, HTMLResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, HTMLResponse, StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 import tempfile
 import shutil
+import sqlite3
+import zlib
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import json
 from pydantic import BaseModel, Field
-from io import BytesIO
-import PyPDF2
-import xml.etree.ElementTree as ET
+import numpy as np
+# Prefer libxml2-backed lxml for GraphML parsing, fall back to the stdlib parser
+try:
+    from lxml import etree as ET
+    LXML_AVAILABLE = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    LXML_AVAILABLE = False
+
+# Prefer lexbor (via selectolax) for HTML text extraction, fall back to BeautifulSoup
+try:
+    from selectolax.parser import HTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+try:
+    from striprtf.striprtf import rtf_to_text
+    STRIPRTF_AVAILABLE = True
+except ImportError:
+    STRIPRTF_AVAILABLE = False
+
+try:
+    from bs4 import BeautifulSoup
+    BS4_AVAILABLE = True
+except ImportError:
+    BS4_AVAILABLE = False
+
+# Prefer orjson for writing the metadata databases, fall back to the stdlib encoder
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Graph visualization dependencies
+try:
+    import networkx as nx
+    from pyvis.network import Network
+    GRAPH_VIZ_AVAILABLE = True
+except ImportError as e:
+    logging.warning(f"Graph visualization not available: {e}")
+    GRAPH_VIZ_AVAILABLE = False
 
 # Import Speech2Text
 from Speech2Text import Speech2Text
@@ -27,6 +83,16 @@ from Speech2Text import Speech2Text
 # Import Text2Speech
 from Text2Speech import Text2Speech
 
+# Per-notebook background ingestion queue
+from ingest_queue import NotebookIngestQueue
+
+# PDF and Office extractors, kept in their own module so document pool workers don't import this one
+from document_workers import (
+    PDFIUM_AVAILABLE, OPENPYXL_AVAILABLE, PANDAS_AVAILABLE, XMLTextCollector, make_upload_xml_parser,
+    extract_pdf_page_range, extract_small_pdf, extract_text_from_docx, read_pptx_slide_range,
+    extract_small_pptx, read_xlsx_sheet_range, extract_small_excel
+)
+
 # LightRAG imports
 try:
     from lightrag import LightRAG, QueryParam
@@ -34,6 +100,9 @@ try:
     from lightrag.llm.ollama import ollama_model_complete, ollama_embed
     from lightrag.utils import EmbeddingFunc, setup_logger
     from lightrag.kg.shared_storage import initialize_pipeline_status
+    from openai import AsyncOpenAI
+    import httpx
+    import ollama
 
     LIGHTRAG_AVAILABLE = True
 except ImportError as e:
@@ -64,7 +133,12 @@ PORT = args.port
 logger.info(f"Starting server on {HOST}:{PORT}")
 
 # Setup FastAPI
-app = FastAPI(title="Clara Backend API", version="1.0.0")
+# Serialize JSON responses with orjson when it's installed
+app = FastAPI(
+    title="Clara Backend API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
+)
 
 # Import and include the diffusers API router
 # Add CORS middleware
@@ -83,8 +157,7 @@ async def catch_exceptions_middleware(request: Request, call_next):
     try:
         return await call_next(request)
     except Exception as e:
-        logger.error(f"Request to {request.url} failed: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"Request to {request.url} failed: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={"error": str(e), "detail": traceback.format_exc()}
@@ -115,147 +188,357 @@ if LIGHTRAG_AVAILABLE:
     # Global storage for LightRAG notebooks and documents
     lightrag_notebooks_db: Dict[str, Dict] = {}
     lightrag_documents_db: Dict[str, Dict] = {}
+    # notebook_id -> {document_id: None}, an insertion-ordered index of lightrag_documents_db
+    notebook_documents_index: Dict[str, Dict[str, None]] = {}
     lightrag_instances: Dict[str, LightRAG] = {}
     # Chat history storage for maintaining conversation context
     chat_history_db: Dict[str, List[Dict]] = {}  # notebook_id -> [messages]
 
-    # Persistence files
+    # Persistence: one SQLite database with a row per notebook, document and chat message.
+    # The dicts above stay the in-memory source of truth; saves write only the rows that changed.
+    METADATA_DB_FILE = LIGHTRAG_METADATA_PATH / "metadata.db"
+    # JSON databases written by earlier versions, imported into SQLite once on startup
     NOTEBOOKS_DB_FILE = LIGHTRAG_METADATA_PATH / "notebooks.json"
     DOCUMENTS_DB_FILE = LIGHTRAG_METADATA_PATH / "documents.json"
     CHAT_HISTORY_DB_FILE = LIGHTRAG_METADATA_PATH / "chat_history.json"
 
-    def save_notebooks_db():
-        """Save notebooks database to disk"""
+    # Writes run on a worker thread, so share one connection behind a lock
+    metadata_db = sqlite3.connect(METADATA_DB_FILE, check_same_thread=False)
+    metadata_db_lock = threading.Lock()
+    metadata_db.execute("PRAGMA journal_mode=WAL")
+    metadata_db.execute("PRAGMA synchronous=NORMAL")
+    metadata_db.executescript("""
+        CREATE TABLE IF NOT EXISTS notebooks (id TEXT PRIMARY KEY, data BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, data BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            notebook_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (notebook_id, idx)
+        );
+    """)
+
+    def json_default(value: Any):
+        """Serialize datetimes for the stdlib JSON encoder"""
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    # Rows at least this big (mostly documents carrying their extracted text) are stored
+    # zlib-compressed; zlib streams start with 0x78 ('x'), which JSON never does
+    ROW_COMPRESS_MIN_BYTES = 4096
+    ROW_COMPRESS_LEVEL = 1
+
+    def encode_row(data: Any) -> bytes:
+        """Serialize a row to JSON bytes (datetimes become ISO strings), compressing large rows"""
+        if ORJSON_AVAILABLE:
+            payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            payload = json.dumps(data, default=json_default).encode()
+        if len(payload) >= ROW_COMPRESS_MIN_BYTES:
+            return zlib.compress(payload, ROW_COMPRESS_LEVEL)
+        return payload
+
+    def decode_row(payload: bytes) -> Any:
+        """Deserialize a row written by encode_row"""
+        if payload[:1] == b'\x78':
+            payload = zlib.decompress(payload)
+        if ORJSON_AVAILABLE:
+            return orjson.loads(payload)
+        return json.loads(payload)
+
+    def migrate_json_db(path: Path, table: str):
+        """Import a JSON database file from an earlier version into SQLite, then set it aside"""
+        if not path.exists():
+            return
         try:
-            # Convert datetime objects to ISO strings for JSON serialization
-            serializable_data = {}
-            for notebook_id, notebook_data in lightrag_notebooks_db.items():
-                serializable_notebook = notebook_data.copy()
-                if isinstance(serializable_notebook.get('created_at'), datetime):
-                    serializable_notebook['created_at'] = serializable_notebook['created_at'].isoformat()
-                serializable_data[notebook_id] = serializable_notebook
-            
-            with open(NOTEBOOKS_DB_FILE, 'w') as f:
-                json.dump(serializable_data, f, indent=2)
-            logger.info(f"Saved {len(serializable_data)} notebooks to {NOTEBOOKS_DB_FILE}")
+            data = decode_row(path.read_bytes())
+            
+            if table == "chat_messages":
+                sql = "INSERT OR REPLACE INTO chat_messages (notebook_id, idx, data) VALUES (?, ?, ?)"
+                rows = [(notebook_id, idx, encode_row(message))
+                        for notebook_id, messages in data.items() for idx, message in enumerate(messages)]
+            else:
+                sql = f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)"
+                rows = [(row_id, encode_row(row)) for row_id, row in data.items()]
+            
+            with metadata_db_lock, metadata_db:
+                metadata_db.executemany(sql, rows)
+            path.rename(path.with_name(path.name + ".migrated"))
+            logger.info(f"Migrated {len(rows)} {table} rows from {path} to {METADATA_DB_FILE}")
         except Exception as e:
-            logger.error(f"Error saving notebooks database: {e}")
+            logger.error(f"Error migrating {path} to {METADATA_DB_FILE}: {e}")
 
     def load_notebooks_db():
         """Load notebooks database from disk"""
         global lightrag_notebooks_db
         try:
-            if NOTEBOOKS_DB_FILE.exists():
-                with open(NOTEBOOKS_DB_FILE, 'r') as f:
-                    data = json.load(f)
-                
+            data = {}
+            for notebook_id, payload in metadata_db.execute("SELECT id, data FROM notebooks ORDER BY rowid"):
+                notebook_data = decode_row(payload)
                 # Convert ISO strings back to datetime objects
-                for notebook_id, notebook_data in data.items():
-                    if isinstance(notebook_data.get('created_at'), str):
-                        notebook_data['created_at'] = datetime.fromisoformat(notebook_data['created_at'])
-                
-                lightrag_notebooks_db = data
-                logger.info(f"Loaded {len(data)} notebooks from {NOTEBOOKS_DB_FILE}")
-            else:
-                logger.info("No existing notebooks database found")
+                if isinstance(notebook_data.get('created_at'), str):
+                    notebook_data['created_at'] = datetime.fromisoformat(notebook_data['created_at'])
+                data[notebook_id] = notebook_data
+            
+            lightrag_notebooks_db = data
+            logger.info(f"Loaded {len(data)} notebooks from {METADATA_DB_FILE}")
         except Exception as e:
             logger.error(f"Error loading notebooks database: {e}")
             lightrag_notebooks_db = {}
 
-    def save_documents_db():
-        """Save documents database to disk"""
-        try:
-            # Convert datetime objects to ISO strings for JSON serialization
-            serializable_data = {}
-            for document_id, document_data in lightrag_documents_db.items():
-                serializable_document = document_data.copy()
-                # Convert all datetime values to ISO strings
-                for key, value in serializable_document.items():
-                    if isinstance(value, datetime):
-                        serializable_document[key] = value.isoformat()
-                serializable_data[document_id] = serializable_document
-            
-            with open(DOCUMENTS_DB_FILE, 'w') as f:
-                json.dump(serializable_data, f, indent=2)
-            logger.info(f"Saved {len(serializable_data)} documents to {DOCUMENTS_DB_FILE}")
-        except Exception as e:
-            logger.error(f"Error saving documents database: {e}")
+    # Document fields stored as datetimes (serialized as ISO strings)
+    DOCUMENT_DATETIME_FIELDS = ('uploaded_at', 'processed_at', 'completed_at', 'failed_at')
 
     def load_documents_db():
         """Load documents database from disk"""
         global lightrag_documents_db
         try:
-            if DOCUMENTS_DB_FILE.exists():
-                with open(DOCUMENTS_DB_FILE, 'r') as f:
-                    data = json.load(f)
-                
+            data = {}
+            for document_id, payload in metadata_db.execute("SELECT id, data FROM documents ORDER BY rowid"):
+                document_data = decode_row(payload)
                 # Convert ISO strings back to datetime objects
-                for document_id, document_data in data.items():
-                    for key, value in document_data.items():
-                        if isinstance(value, str) and key.endswith('_at'):
-                            try:
-                                document_data[key] = datetime.fromisoformat(value)
-                            except ValueError:
-                                pass  # Keep as string if not a valid ISO datetime
-                
-                lightrag_documents_db = data
-                logger.info(f"Loaded {len(data)} documents from {DOCUMENTS_DB_FILE}")
-            else:
-                logger.info("No existing documents database found")
+                for key in DOCUMENT_DATETIME_FIELDS:
+                    value = document_data.get(key)
+                    if value.__class__ is str:
+                        try:
+                            document_data[key] = datetime.fromisoformat(value)
+                        except ValueError:
+                            pass  # Keep as string if not a valid ISO datetime
+                data[document_id] = document_data
+            
+            lightrag_documents_db = data
+            rebuild_notebook_documents_index()
+            logger.info(f"Loaded {len(data)} documents from {METADATA_DB_FILE}")
         except Exception as e:
             logger.error(f"Error loading documents database: {e}")
             lightrag_documents_db = {}
 
-    def save_chat_history_db():
-        """Save chat history database to disk"""
+    def rebuild_notebook_documents_index():
+        """Rebuild the notebook -> documents index from lightrag_documents_db"""
+        notebook_documents_index.clear()
+        for document_id, document_data in lightrag_documents_db.items():
+            notebook_documents_index.setdefault(document_data["notebook_id"], {})[document_id] = None
+
+    def add_notebook_document(document_data: Dict):
+        """Add a document to lightrag_documents_db and the notebook index"""
+        lightrag_documents_db[document_data["id"]] = document_data
+        notebook_documents_index.setdefault(document_data["notebook_id"], {})[document_data["id"]] = None
+
+    def remove_notebook_document(document_id: str):
+        """Remove a document from lightrag_documents_db and the notebook index"""
+        document_data = lightrag_documents_db.pop(document_id)
+        notebook_documents_index.get(document_data["notebook_id"], {}).pop(document_id, None)
+
+    def bump_docs_version(notebook_id: str):
+        """Bump a notebook's documents version, invalidating summary/citation/query caches"""
+        notebook_data = lightrag_notebooks_db.get(notebook_id)
+        if notebook_data is not None:
+            notebook_data["docs_version"] = notebook_data.get("docs_version", 0) + 1
+
+    def get_notebook_documents(notebook_id: str, status: Optional[str] = None) -> List[Dict]:
+        """Get a notebook's documents in upload order, optionally filtered by status"""
+        documents = [lightrag_documents_db[doc_id] for doc_id in notebook_documents_index.get(notebook_id, ())]
+        if status is not None:
+            documents = [doc for doc in documents if doc["status"] == status]
+        return documents
+
+    # Saves only mark rows dirty; a debounced flush upserts or deletes each dirty row at
+    # most once per interval, so bulk uploads and chat bursts become one small transaction.
+    # Rows are encoded on the loop and written from a worker thread to keep the loop free.
+    DB_FLUSH_INTERVAL_SECONDS = 0.5
+    dirty_rows: Dict[str, set] = {"notebooks": set(), "documents": set(), "chat_history": set()}
+    # notebook_id -> number of chat messages already in SQLite (chat history is append-only)
+    chat_rows_saved: Dict[str, int] = {}
+    # Only the most recent messages of each notebook stay in chat_history_db once they're
+    # on disk; notebook_id -> SQLite idx of chat_history_db[notebook_id][0]
+    CHAT_HISTORY_MEMORY_MESSAGES = 200
+    chat_history_offsets: Dict[str, int] = {}
+    db_flush_task: Optional[asyncio.Task] = None
+
+    def collect_dirty_rows():
+        """Encode every dirty row as (sql, rows) batches and clear the dirty sets"""
+        taken = {name: set(ids) for name, ids in dirty_rows.items()}
+        for ids in dirty_rows.values():
+            ids.clear()
+        
+        batches = []
+        for table, db in (("notebooks", lightrag_notebooks_db), ("documents", lightrag_documents_db)):
+            batches.append((
+                f"INSERT INTO {table} (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                [(row_id, encode_row(db[row_id])) for row_id in taken[table] if row_id in db]
+            ))
+            batches.append((f"DELETE FROM {table} WHERE id = ?", [(row_id,) for row_id in taken[table] if row_id not in db]))
+        
+        chat_deletes, chat_upserts = [], []
+        for notebook_id in taken["chat_history"]:
+            messages = chat_history_db.get(notebook_id, [])
+            offset = chat_history_offsets.get(notebook_id, 0)
+            total = offset + len(messages)
+            saved = min(max(chat_rows_saved.get(notebook_id, 0), offset), total)
+            chat_deletes.append((notebook_id, total))
+            chat_upserts.extend((notebook_id, idx, encode_row(messages[idx - offset])) for idx in range(saved, total))
+            chat_rows_saved[notebook_id] = total
+        batches.append(("DELETE FROM chat_messages WHERE notebook_id = ? AND idx >= ?", chat_deletes))
+        batches.append(("INSERT OR REPLACE INTO chat_messages (notebook_id, idx, data) VALUES (?, ?, ?)", chat_upserts))
+        return taken, batches
+
+    def write_rows(batches):
+        """Apply (sql, rows) batches in a single transaction"""
+        with metadata_db_lock, metadata_db:
+            for sql, rows in batches:
+                if rows:
+                    metadata_db.executemany(sql, rows)
+
+    def trim_chat_history(notebook_ids):
+        """Drop saved messages beyond the in-memory window; they remain in SQLite"""
+        for notebook_id in notebook_ids:
+            messages = chat_history_db.get(notebook_id)
+            if not messages:
+                continue
+            offset = chat_history_offsets.get(notebook_id, 0)
+            excess = min(len(messages) - CHAT_HISTORY_MEMORY_MESSAGES, chat_rows_saved.get(notebook_id, 0) - offset)
+            if excess > 0:
+                del messages[:excess]
+                chat_history_offsets[notebook_id] = offset + excess
+
+    def restore_dirty_rows(taken: Dict[str, set]):
+        """Mark rows dirty again after a failed write so the next flush retries them"""
+        for name, ids in taken.items():
+            dirty_rows[name] |= ids
+        for notebook_id in taken["chat_history"]:
+            chat_rows_saved.pop(notebook_id, None)
+
+    def flush_dirty_dbs():
+        """Write every dirty row to disk now"""
+        if not any(dirty_rows.values()):
+            return
+        taken, batches = collect_dirty_rows()
         try:
-            # Convert datetime objects to ISO strings for JSON serialization
-            serializable_data = {}
-            for notebook_id, messages in chat_history_db.items():
-                serializable_messages = []
-                for message in messages:
-                    serializable_message = message.copy()
-                    if isinstance(serializable_message.get('timestamp'), datetime):
-                        serializable_message['timestamp'] = serializable_message['timestamp'].isoformat()
-                    serializable_messages.append(serializable_message)
-                serializable_data[notebook_id] = serializable_messages
-            
-            with open(CHAT_HISTORY_DB_FILE, 'w') as f:
-                json.dump(serializable_data, f, indent=2)
-            logger.info(f"Saved chat history for {len(serializable_data)} notebooks to {CHAT_HISTORY_DB_FILE}")
+            write_rows(batches)
+            trim_chat_history(taken["chat_history"])
         except Exception as e:
-            logger.error(f"Error saving chat history database: {e}")
+            logger.error(f"Error saving metadata database: {e}")
+            restore_dirty_rows(taken)
+
+    async def flush_dirty_dbs_later():
+        """Write every dirty row after the debounce interval"""
+        await asyncio.sleep(DB_FLUSH_INTERVAL_SECONDS)
+        while any(dirty_rows.values()):
+            taken, batches = collect_dirty_rows()
+            try:
+                await asyncio.to_thread(write_rows, batches)
+                trim_chat_history(taken["chat_history"])
+                logger.info(f"Saved {sum(len(rows) for _, rows in batches)} metadata rows to {METADATA_DB_FILE}")
+            except Exception as e:
+                logger.error(f"Error saving metadata database: {e}")
+                restore_dirty_rows(taken)
+                break
+
+    def mark_db_dirty(name: str, ids):
+        """Schedule rows to be written by the next debounced flush"""
+        global db_flush_task
+        if not ids:
+            return
+        dirty_rows[name].update(ids)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. during startup), write immediately
+            flush_dirty_dbs()
+            return
+        if db_flush_task is None or db_flush_task.done():
+            db_flush_task = loop.create_task(flush_dirty_dbs_later())
+
+    def save_notebooks_db(*notebook_ids: str):
+        """Save notebooks to disk (debounced); deleted ids are removed from disk"""
+        mark_db_dirty("notebooks", notebook_ids)
+
+    def save_documents_db(*document_ids: str):
+        """Save documents to disk (debounced); deleted ids are removed from disk"""
+        mark_db_dirty("documents", document_ids)
+
+    def save_chat_history_db(*notebook_ids: str):
+        """Save notebooks' chat history to disk (debounced)"""
+        mark_db_dirty("chat_history", notebook_ids)
+
+    def clear_notebook_chat_history(notebook_id: str):
+        """Remove a notebook's chat history from memory and disk"""
+        chat_history_db.pop(notebook_id, None)
+        chat_history_offsets.pop(notebook_id, None)
+        chat_rows_saved[notebook_id] = 0
+        save_chat_history_db(notebook_id)
+
+    def get_chat_history_total(notebook_id: str) -> int:
+        """Total number of messages in a notebook's chat history, including those only on disk"""
+        return chat_history_offsets.get(notebook_id, 0) + len(chat_history_db.get(notebook_id, []))
+
+    def decode_chat_message(payload: bytes) -> Dict:
+        """Decode a chat message row"""
+        message = decode_row(payload)
+        # Convert ISO strings back to datetime objects
+        if isinstance(message.get('timestamp'), str):
+            try:
+                message['timestamp'] = datetime.fromisoformat(message['timestamp'])
+            except ValueError:
+                pass  # Keep as string if not a valid ISO datetime
+        return message
+
+    def load_older_chat_messages(notebook_id: str, before_idx: int, count: int) -> List[Dict]:
+        """Read up to count messages preceding before_idx from SQLite, oldest first"""
+        with metadata_db_lock:
+            rows = metadata_db.execute(
+                "SELECT data FROM chat_messages WHERE notebook_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                (notebook_id, max(0, before_idx - count), before_idx)
+            ).fetchall()
+        return [decode_chat_message(payload) for (payload,) in rows]
+
+    @app.on_event("shutdown")
+    async def flush_dbs_on_shutdown():
+        # Let an in-flight flush finish so it doesn't race the final write
+        if db_flush_task is not None and not db_flush_task.done():
+            await db_flush_task
+        flush_dirty_dbs()
+        metadata_db.close()
 
     def load_chat_history_db():
         """Load chat history database from disk"""
         global chat_history_db
         try:
-            if CHAT_HISTORY_DB_FILE.exists():
-                with open(CHAT_HISTORY_DB_FILE, 'r') as f:
-                    data = json.load(f)
-                
-                # Convert ISO strings back to datetime objects
-                for notebook_id, messages in data.items():
-                    for message in messages:
-                        if isinstance(message.get('timestamp'), str):
-                            try:
-                                message['timestamp'] = datetime.fromisoformat(message['timestamp'])
-                            except ValueError:
-                                pass  # Keep as string if not a valid ISO datetime
-                
-                chat_history_db = data
-                logger.info(f"Loaded chat history for {len(data)} notebooks from {CHAT_HISTORY_DB_FILE}")
-            else:
-                logger.info("No existing chat history database found")
+            data: Dict[str, List[Dict]] = {}
+            # Only the last CHAT_HISTORY_MEMORY_MESSAGES of each notebook are loaded
+            rows = metadata_db.execute("""
+                SELECT m.notebook_id, m.idx, m.data, t.last_idx FROM chat_messages m
+                JOIN (SELECT notebook_id, MAX(idx) AS last_idx FROM chat_messages GROUP BY notebook_id) t
+                ON m.notebook_id = t.notebook_id
+                WHERE m.idx > t.last_idx - ?
+                ORDER BY m.notebook_id, m.idx
+            """, (CHAT_HISTORY_MEMORY_MESSAGES,))
+            for notebook_id, idx, payload, last_idx in rows:
+                if notebook_id not in data:
+                    chat_history_offsets[notebook_id] = idx
+                    chat_rows_saved[notebook_id] = last_idx + 1
+                data.setdefault(notebook_id, []).append(decode_chat_message(payload))
+            
+            chat_history_db = data
+            logger.info(f"Loaded chat history for {len(data)} notebooks from {METADATA_DB_FILE}")
         except Exception as e:
             logger.error(f"Error loading chat history database: {e}")
             chat_history_db = {}
 
-    # Load existing data on startup
+    # Import JSON databases from earlier versions, then load existing data on startup
+    migrate_json_db(NOTEBOOKS_DB_FILE, "notebooks")
+    migrate_json_db(DOCUMENTS_DB_FILE, "documents")
+    migrate_json_db(CHAT_HISTORY_DB_FILE, "chat_messages")
     load_notebooks_db()
     load_documents_db()
     load_chat_history_db()
 
+# Speech models are loaded in the background at startup; the locks stop a request
+# that arrives mid-load from building a second copy
+speech2text_lock = threading.Lock()
+text2speech_lock = threading.Lock()
+
 # Speech2Text instance cache
 speech2text_instance = None
 
@@ -263,13 +546,14 @@ def get_speech2text():
     """Create or retrieve the Speech2Text instance from cache"""
     global speech2text_instance
     
-    if speech2text_instance is None:
-        # Use tiny model with CPU for maximum compatibility
-        speech2text_instance = Speech2Text(
-            model_size="tiny",
-            device="cpu",
-            compute_type="int8"
-        )
+    with speech2text_lock:
+        if speech2text_instance is None:
+            # Use tiny model with CPU for maximum compatibility
+            speech2text_instance = Speech2Text(
+                model_size="tiny",
+                device="cpu",
+                compute_type="int8"
+            )
     
     return speech2text_instance
 
@@ -280,18 +564,203 @@ def get_text2speech():
     """Create or retrieve the Text2Speech instance from cache"""
     global text2speech_instance
     
-    if text2speech_instance is None:
-        # Initialize with auto engine selection (will prefer Kokoro if available)
-        text2speech_instance = Text2Speech(
-            engine="auto",
-            language="en",
-            slow=False,
-            voice="af_sarah",
-            speed=1.0
-        )
+    with text2speech_lock:
+        if text2speech_instance is None:
+            # Initialize with auto engine selection (will prefer Kokoro if available)
+            text2speech_instance = Text2Speech(
+                engine="auto",
+                language="en",
+                slow=False,
+                voice="af_sarah",
+                speed=1.0
+            )
     
     return text2speech_instance
 
+speech_models_warmup_task: Optional[asyncio.Task] = None
+
+async def warm_up_speech_model(name: str, getter):
+    """Load a speech model off the event loop so the first request doesn't pay for it"""
+    try:
+        await run_in_threadpool(getter)
+        logger.info(f"{name} model loaded")
+    except Exception as e:
+        logger.warning(f"Could not preload {name} model: {e}")
+
+async def warm_up_speech_models():
+    await asyncio.gather(
+        warm_up_speech_model("Speech2Text", get_speech2text),
+        warm_up_speech_model("Text2Speech", get_text2speech)
+    )
+
+@app.on_event("startup")
+async def start_speech_models_warmup():
+    global speech_models_warmup_task
+    speech_models_warmup_task = asyncio.create_task(warm_up_speech_models())
+
+# Synthesis runs on the threadpool to keep the event loop free, but the TTS engines
+# (pyttsx3 in particular) aren't thread-safe, so only one synthesis runs at a time
+tts_lock = threading.Lock()
+
+def run_tts(synthesize, *args):
+    """Run a Text2Speech synthesis call while holding the TTS lock"""
+    with tts_lock:
+        return synthesize(*args)
+
+@lru_cache(maxsize=8)
+def get_text2speech_for(engine: str, language: str, slow: bool, voice: str, speed: float):
+    """Create or retrieve a Text2Speech instance for a specific engine configuration"""
+    logger.info(f"Creating new TTS instance with engine: {engine}")
+    return Text2Speech(
+        engine=engine,
+        language=language,
+        slow=slow,
+        voice=voice,
+        speed=speed
+    )
+
+class OllamaBatcher:
+    """Adaptive batch sizing for Ollama embeddings.
+
+    Starts small, grows the batch by one while the EMA of per-item latency keeps
+    improving, and halves it on timeouts, connection errors and 5xx responses.
+    Any other error is raised straight away; a smaller batch wouldn't fix it.
+    """
+
+    def __init__(self, embed_func, initial_batch_size: int = 4, max_batch_size: int = 64, alpha: float = 0.3):
+        self.embed_func = embed_func
+        self.batch_size = initial_batch_size
+        self.max_batch_size = max_batch_size
+        self.alpha = alpha
+        self.latency_per_item: Optional[float] = None  # EMA in seconds
+
+    @staticmethod
+    def is_overload_error(error: Exception) -> bool:
+        """Whether a failed batch looks like the server struggling rather than a bad request"""
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+            return True
+        if LIGHTRAG_AVAILABLE and isinstance(error, httpx.TransportError):
+            return True
+        # ollama.ResponseError carries the status itself, httpx.HTTPStatusError on its response
+        status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        return isinstance(status_code, int) and status_code >= 500
+
+    def _observe(self, batch_len: int, elapsed: float):
+        per_item = elapsed / batch_len
+        if self.latency_per_item is None:
+            self.latency_per_item = per_item
+            return
+        improved = per_item < self.latency_per_item
+        self.latency_per_item = self.alpha * per_item + (1 - self.alpha) * self.latency_per_item
+        # Only full batches say anything about whether a bigger batch helps
+        if improved and batch_len >= self.batch_size and self.batch_size < self.max_batch_size:
+            self.batch_size += 1
+            logger.info(f"Ollama embedding batch size increased to {self.batch_size}")
+
+    async def embed(self, texts: List[str]) -> list:
+        embeddings = []
+        i = 0
+        while i < len(texts):
+            batch = texts[i:i + self.batch_size]
+            start = time.monotonic()
+            try:
+                result = await self.embed_func(batch)
+            except Exception as e:
+                if len(batch) > 1 and self.is_overload_error(e):
+                    self.batch_size = max(1, min(self.batch_size, len(batch)) // 2)
+                    logger.warning(f"Ollama embedding batch of {len(batch)} failed ({e}), reducing batch size to {self.batch_size}")
+                    continue
+                raise
+            self._observe(len(batch), time.monotonic() - start)
+            embeddings.extend(result)
+            i += len(batch)
+        return embeddings
+
+class QueryResponseCache:
+    """In-process LRU cache of notebook query responses.
+
+    Bounded by entry count, approximate answer size and a TTL. Keys carry the
+    notebook's documents version, so a document change makes old entries miss.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (stored_at, size, value)
+        self._total_bytes = 0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def make_key(notebook_id: str, question: str, mode: str, top_k: int, response_type: str, docs_version: int) -> tuple:
+        normalized_question = " ".join(question.lower().split())
+        question_hash = hashlib.sha1(normalized_question.encode()).hexdigest()
+        return (notebook_id, question_hash, mode, top_k, response_type, docs_version)
+
+    async def get(self, key: tuple):
+        async with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, size, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def put(self, key: tuple, value: Dict[str, Any]):
+        size = sys.getsizeof(value.get("answer", ""))
+        async with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), size, value)
+            self._total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    async def invalidate_notebook(self, notebook_id: str):
+        async with self._lock:
+            for key in [key for key in self._entries if key[0] == notebook_id]:
+                self._remove(key)
+
+    def _remove(self, key: tuple):
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+class ExtractedTextCache:
+    """In-process LRU cache of text extracted from uploads, keyed on a content hash.
+
+    Re-uploads and retries of the same file skip parsing entirely. Bounded by
+    entry count and approximate text size; only touched from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (size, text)
+        self._total_bytes = 0
+
+    @staticmethod
+    def make_key(file_ext: str, file_content: bytes) -> tuple:
+        return (file_ext, hashlib.blake2b(file_content, digest_size=16).digest())
+
+    def get(self, key: tuple) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: tuple, text: str):
+        size = sys.getsizeof(text)
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)[0]
+        self._entries[key] = (size, text)
+        self._total_bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            self._total_bytes -= self._entries.popitem(last=False)[1][0]
+
 # LightRAG Utility Functions
 if LIGHTRAG_AVAILABLE:
     def create_llm_func(provider_config: Dict[str, Any]):
@@ -401,24 +870,157 @@ if LIGHTRAG_AVAILABLE:
             logger.error(f"Error creating embedding function for provider {provider_type}: {e}")
             raise
 
+    # Large OpenAI-compatible embedding calls are split into sub-batches sent concurrently,
+    # with a per-provider cap on how many are in flight
+    EMBEDDING_SUB_BATCH_SIZE = 64
+    EMBEDDING_MAX_CONCURRENT_BATCHES = 8
+
+    # Clara Core limits the length of each text, not how many go in a request
+    CLARA_CORE_EMBEDDING_BATCH_SIZE = 8
+
+    # Pooled HTTP clients for embedding providers, keyed by endpoint, so batches
+    # reuse keep-alive connections instead of paying TCP/TLS setup on every call
+    EMBEDDING_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=50, keepalive_expiry=300)
+    embedding_clients: Dict[tuple, Any] = {}
+
+    def get_openai_embedding_client(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """Get or create a pooled OpenAI client for an embedding endpoint"""
+        key = ("openai", base_url, api_key)
+        if key not in embedding_clients:
+            embedding_clients[key] = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url or None,
+                http_client=httpx.AsyncClient(limits=EMBEDDING_HTTP_LIMITS, timeout=300)
+            )
+        return embedding_clients[key]
+
+    def get_ollama_embedding_client(host: str) -> ollama.AsyncClient:
+        """Get or create a pooled Ollama client for an embedding host"""
+        key = ("ollama", host)
+        if key not in embedding_clients:
+            embedding_clients[key] = ollama.AsyncClient(host=host, timeout=300, limits=EMBEDDING_HTTP_LIMITS)
+        return embedding_clients[key]
+
+    async def pooled_openai_embed(texts: list[str], model: str, api_key: str, base_url: Optional[str] = None) -> np.ndarray:
+        """OpenAI embeddings over a pooled client (same result shape as LightRAG's openai_embed)"""
+        client = get_openai_embedding_client(api_key, base_url)
+        response = await client.embeddings.create(model=model, input=texts, encoding_format="float")
+        return np.array([dp.embedding for dp in response.data])
+
+    async def pooled_ollama_embed(texts: list[str], embed_model: str, host: str) -> np.ndarray:
+        """Ollama embeddings over a pooled client (same result shape as LightRAG's ollama_embed)"""
+        client = get_ollama_embedding_client(host)
+        data = await client.embed(model=embed_model, input=texts)
+        return np.array(data["embeddings"])
+
+    async def close_embedding_clients():
+        """Close all pooled embedding clients"""
+        for key, client in list(embedding_clients.items()):
+            try:
+                if isinstance(client, AsyncOpenAI):
+                    await client.close()
+                else:
+                    await client._client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing embedding client {key[0]}: {e}")
+        embedding_clients.clear()
+
+    @app.on_event("shutdown")
+    async def shutdown_embedding_clients():
+        await close_embedding_clients()
+
+    # Larger PDFs, workbooks and presentations are extracted as page/sheet/slide ranges on a
+    # process pool: PyPDF2 and the XML parsers hold the GIL and PDFium isn't thread-safe, so
+    # threads alone wouldn't use more than one core. Small documents aren't worth the hop.
+    PDF_MIN_PAGES_PER_TASK = 4
+    DOCUMENT_PROCESS_MIN_BYTES = 1024 * 1024
+    DOCUMENT_PROCESS_WORKERS = max(1, int(os.getenv("CLARA_DOCUMENT_WORKERS", min(os.cpu_count() or 1, 4))))
+    document_process_pool: Optional[ProcessPoolExecutor] = None
+    # Workers are forked explicitly rather than left to the platform default: spawn and
+    # forkserver workers re-run the parent's __main__ (this file) as __mp_main__, which would
+    # parse arguments, load the databases and install signal handlers in every worker. Where
+    # fork isn't available (Windows) the extractors run on threads instead.
+    DOCUMENT_PROCESS_CONTEXT = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+
     def extract_text_from_pdf_lightrag(pdf_bytes: bytes) -> str:
         """Extract text from PDF bytes for LightRAG"""
         try:
-            pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            return extract_pdf_page_range(pdf_bytes, 0)
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {e}")
             raise HTTPException(status_code=400, detail=f"Error processing PDF: {str(e)}")
 
-    # Additional format support endpoint
-    @app.get("/notebooks/supported-formats")
-    async def get_supported_formats():
-        """Get information about supported file formats for notebook documents"""
+    def run_in_document_process(func, *args) -> asyncio.Future:
+        """Schedule func(*args) on the shared document process pool"""
+        # func should come from document_workers, which a worker can import without side effects
+        global document_process_pool
+        if DOCUMENT_PROCESS_CONTEXT is None:
+            return asyncio.get_running_loop().run_in_executor(None, func, *args)
+        if document_process_pool is None:
+            document_process_pool = ProcessPoolExecutor(max_workers=DOCUMENT_PROCESS_WORKERS, mp_context=DOCUMENT_PROCESS_CONTEXT)
+        return asyncio.get_running_loop().run_in_executor(document_process_pool, func, *args)
+
+    async def map_document_ranges(func, file_content: bytes, part_count: int, min_parts_per_task: int = 1) -> list:
+        """Run func(file_content, start, end) over one part range per worker process, in order"""
+        # Each task pays for shipping the whole document to its worker, so don't cut ranges too thin
+        parts_per_task = max(-(-part_count // DOCUMENT_PROCESS_WORKERS), min_parts_per_task)
+        return await asyncio.gather(*[
+            run_in_document_process(func, file_content, start, min(start + parts_per_task, part_count))
+            for start in range(0, part_count, parts_per_task)
+        ])
+
+    async def extract_text_from_pdf_lightrag_async(pdf_bytes: bytes) -> str:
+        """Extract text from PDF bytes off the event loop, splitting large PDFs across processes"""
+        loop = asyncio.get_running_loop()
+        try:
+            page_count, text = await loop.run_in_executor(None, extract_small_pdf, pdf_bytes)
+            if text is not None:
+                return text
+            
+            return "".join(await map_document_ranges(extract_pdf_page_range, pdf_bytes, page_count, PDF_MIN_PAGES_PER_TASK))
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF: {e}")
+            raise HTTPException(status_code=400, detail=f"Error processing PDF: {str(e)}")
+
+    @app.on_event("shutdown")
+    async def shutdown_document_process_pool():
+        if document_process_pool is not None:
+            document_process_pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract_text_from_markup(file_content: bytes, parser: str) -> str:
+        """Extract visible text from HTML/XML, preferring the C parsers over BeautifulSoup"""
+        if parser == 'xml':
+            try:
+                # Stream text events straight off the parser instead of building a tree
+                xml_parser = make_upload_xml_parser(XMLTextCollector(), huge_tree=True)
+                xml_parser.feed(file_content)
+                return xml_parser.close()
+            except ET.ParseError:
+                pass  # Let BeautifulSoup's more forgiving parser have a go
+        
+        content = file_content.decode('utf-8')
+        if parser == 'html.parser' and SELECTOLAX_AVAILABLE:
+            tree = HTMLParser(content)
+            tree.strip_tags(['script', 'style'])
+            root = tree.body or tree.root
+            if root is None:
+                return ""
+            text = root.text(separator='\n', strip=True)
+            return "\n".join(line for line in text.split('\n') if line)
+        
+        if not BS4_AVAILABLE:
+            return content
+        
+        # BeautifulSoup's own html.parser is pure Python; use lxml's C parser when present
+        if parser == 'html.parser' and LXML_AVAILABLE:
+            parser = 'lxml'
+        soup = BeautifulSoup(content, parser)
+        return soup.get_text(separator='\n', strip=True)
+
+    def build_supported_formats_json() -> bytes:
+        """Build and serialize the supported formats listing; it's fixed for the life of the process"""
         basic_formats = [
-            {"extension": "pdf", "description": "PDF documents", "library": "PyPDF2 (built-in)"},
+            {"extension": "pdf", "description": "PDF documents", "library": "pypdfium2" if PDFIUM_AVAILABLE else "PyPDF2 (built-in)"},
             {"extension": "txt", "description": "Plain text files", "library": "built-in"},
             {"extension": "md", "description": "Markdown files", "library": "built-in"},
             {"extension": "csv", "description": "Comma-separated values", "library": "built-in"},
@@ -431,7 +1033,7 @@ if LIGHTRAG_AVAILABLE:
         enhanced_formats = [
             {"extension": "docx", "description": "Word documents (newer)", "library": "python-docx", "install": "pip install python-docx"},
             {"extension": "doc", "description": "Word documents (legacy)", "library": "python-docx", "install": "pip install python-docx"},
-            {"extension": "xlsx", "description": "Excel spreadsheets (newer)", "library": "pandas + openpyxl", "install": "pip install pandas openpyxl"},
+            {"extension": "xlsx", "description": "Excel spreadsheets (newer)", "library": "openpyxl", "install": "pip install openpyxl"},
             {"extension": "xls", "description": "Excel spreadsheets (legacy)", "library": "pandas + xlrd", "install": "pip install pandas xlrd"},
             {"extension": "pptx", "description": "PowerPoint presentations (newer)", "library": "python-pptx", "install": "pip install python-pptx"},
             {"extension": "ppt", "description": "PowerPoint presentations (legacy)", "library": "python-pptx", "install": "pip install python-pptx"},
@@ -445,7 +1047,7 @@ if LIGHTRAG_AVAILABLE:
             {"extension": "odp", "description": "OpenDocument Presentation", "library": "textract", "install": "pip install textract"}
         ]
         
-        return {
+        supported_formats = {
             "basic_support": [f".{fmt['extension']}" for fmt in basic_formats],
             "enhanced_support": [f".{fmt['extension']}" for fmt in enhanced_formats],
             "textract_support": [f".{fmt['extension']}" for fmt in textract_formats],
@@ -464,157 +1066,204 @@ if LIGHTRAG_AVAILABLE:
                 "pip install textract  # Optional for additional formats"
             ]
         }
+        
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(supported_formats)
+        return json.dumps(supported_formats).encode()
+
+    SUPPORTED_FORMATS_JSON = build_supported_formats_json()
+
+    # Additional format support endpoint
+    @app.get("/notebooks/supported-formats")
+    async def get_supported_formats():
+        """Get information about supported file formats for notebook documents"""
+        return Response(content=SUPPORTED_FORMATS_JSON, media_type="application/json")
+
+    async def extract_plain_text(file_ext: str, file_content: bytes) -> str:
+        """Decode plain text, markdown and CSV files"""
+        return file_content.decode('utf-8')
+
+    def pretty_print_json(file_content: bytes) -> str:
+        """Re-indent JSON bytes for indexing"""
+        return json.dumps(json.loads(file_content.decode('utf-8')), indent=2)
+
+    async def extract_json_text(file_ext: str, file_content: bytes) -> str:
+        """Pretty-print JSON files"""
+        return await asyncio.to_thread(pretty_print_json, file_content)
+
+    async def extract_markup_text(file_ext: str, file_content: bytes) -> str:
+        """Extract text from XML/HTML files"""
+        parser = 'html.parser' if file_ext in ['html', 'htm'] else 'xml'
+        return await asyncio.to_thread(extract_text_from_markup, file_content, parser)
+
+    async def extract_pdf_text(file_ext: str, file_content: bytes) -> str:
+        """Extract text from PDF files"""
+        return await extract_text_from_pdf_lightrag_async(file_content)
+
+    async def extract_word_text(file_ext: str, file_content: bytes) -> str:
+        """Extract text from Word documents"""
+        # Parsing a large document holds the GIL long enough to stall the event loop
+        # even from a thread, so those go to the process pool
+        if len(file_content) >= DOCUMENT_PROCESS_MIN_BYTES:
+            return await run_in_document_process(extract_text_from_docx, file_content)
+        return await asyncio.to_thread(extract_text_from_docx, file_content)
+
+    async def extract_spreadsheet_text(file_ext: str, file_content: bytes) -> str:
+        """Extract text from Excel spreadsheets"""
+        if not (OPENPYXL_AVAILABLE if file_ext == 'xlsx' else PANDAS_AVAILABLE):
+            logger.warning("openpyxl/pandas not available, cannot process Excel files")
+            raise HTTPException(
+                status_code=400, 
+                detail="Excel processing requires pandas and openpyxl libraries. Install with: pip install pandas openpyxl xlrd"
+            )
+        
+        sheet_count, content_parts = await asyncio.to_thread(extract_small_excel, file_ext, file_content)
+        if content_parts is None:
+            sheet_ranges = await map_document_ranges(read_xlsx_sheet_range, file_content, sheet_count)
+            content_parts = [part for sheet_range in sheet_ranges for part in sheet_range]
+        return "\n\n" + "="*50 + "\n\n".join(content_parts)
+
+    async def extract_presentation_text(file_ext: str, file_content: bytes) -> str:
+        """Extract text from PowerPoint presentations"""
+        slide_count, text = await asyncio.to_thread(extract_small_pptx, file_content)
+        if text is not None:
+            return text
+        
+        slide_ranges = await map_document_ranges(read_pptx_slide_range, file_content, slide_count)
+        return "\n\n".join(section for slide_range in slide_ranges for section in slide_range)
+
+    def extract_text_from_rtf(file_content: bytes) -> str:
+        """Strip RTF markup from uploaded bytes"""
+        # RTF itself is 7-bit and escapes everything else, but some writers emit raw UTF-8;
+        # anything that isn't UTF-8 is read as latin-1, which can't fail, instead of being rejected
+        try:
+            rtf_content = file_content.decode('utf-8')
+        except UnicodeDecodeError:
+            rtf_content = file_content.decode('latin-1')
+        return rtf_to_text(rtf_content, errors='replace')
+
+    async def extract_rtf_text(file_ext: str, file_content: bytes) -> str:
+        """Extract text from RTF files"""
+        if not STRIPRTF_AVAILABLE:
+            logger.warning("striprtf not available, cannot process RTF files")
+            raise HTTPException(
+                status_code=400, 
+                detail="RTF processing requires striprtf library. Install with: pip install striprtf"
+            )
+        
+        return await asyncio.to_thread(extract_text_from_rtf, file_content)
+
+    async def reject_libreoffice_format(file_ext: str, file_content: bytes) -> str:
+        """LibreOffice formats need converting before upload"""
+        logger.warning(f"LibreOffice format {file_ext} requires conversion to supported format")
+        raise HTTPException(
+            status_code=400, 
+            detail=f"LibreOffice {file_ext.upper()} files are not directly supported. Please convert to DOCX, PDF, or TXT format."
+        )
+
+    # textract only takes a path (most of its backends are external programs), so stage the
+    # upload on tmpfs where there is one to keep it in memory rather than on disk. tmpfs can
+    # be small (Docker's /dev/shm defaults to 64 MB, shared by concurrent uploads), so it's
+    # only used when the file fits with room to spare, and the default temp dir is the fallback.
+    TEXTRACT_TMPFS_DIR = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+    TEXTRACT_TMPFS_HEADROOM = 4
+
+    def write_temp_upload(file_ext: str, file_content: bytes, temp_dir: Optional[str]) -> str:
+        """Write an upload to a temporary file in temp_dir and return its path"""
+        # delete=False so the file can be reopened by textract on Windows too
+        temp_file = tempfile.NamedTemporaryFile(suffix=f'.{file_ext}', dir=temp_dir, delete=False)
+        try:
+            with temp_file:
+                temp_file.write(file_content)
+        except OSError:
+            os.unlink(temp_file.name)
+            raise
+        return temp_file.name
+
+    def stage_textract_upload(file_ext: str, file_content: bytes) -> str:
+        """Write an upload for textract, on tmpfs when it comfortably fits"""
+        if TEXTRACT_TMPFS_DIR:
+            try:
+                if len(file_content) * TEXTRACT_TMPFS_HEADROOM <= shutil.disk_usage(TEXTRACT_TMPFS_DIR).free:
+                    return write_temp_upload(file_ext, file_content, TEXTRACT_TMPFS_DIR)
+            except OSError as e:
+                logger.warning(f"Could not stage upload on {TEXTRACT_TMPFS_DIR}, using the default temp dir: {e}")
+        return write_temp_upload(file_ext, file_content, None)
+
+    def run_textract(file_ext: str, file_content: bytes) -> str:
+        """Write the upload to a temporary file and extract its text with textract"""
+        import textract
+        temp_path = stage_textract_upload(file_ext, file_content)
+        try:
+            return textract.process(temp_path).decode('utf-8')
+        finally:
+            os.unlink(temp_path)
+
+    async def extract_textract_text(filename: str, file_ext: str, file_content: bytes) -> str:
+        """Use textract as fallback for other formats if available"""
+        try:
+            return await asyncio.to_thread(run_textract, file_ext, file_content)
+        except ImportError:
+            logger.warning("textract not available for additional format support")
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Unsupported file type: {filename}. Supported formats: PDF, TXT, MD, CSV, JSON, XML, HTML, DOCX, DOC, XLSX, XLS, PPTX, PPT, RTF. For more formats, install: pip install textract"
+            )
+        except Exception as e:
+            logger.error(f"Error processing file with textract: {e}")
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Error processing file {filename}: {str(e)}"
+            )
+
+    # File extension -> text extractor; anything else goes to textract
+    FILE_TEXT_EXTRACTORS = {
+        'pdf': extract_pdf_text,
+        'txt': extract_plain_text,
+        'md': extract_plain_text,
+        'markdown': extract_plain_text,
+        'rst': extract_plain_text,
+        'csv': extract_plain_text,
+        'json': extract_json_text,
+        'xml': extract_markup_text,
+        'html': extract_markup_text,
+        'htm': extract_markup_text,
+        'docx': extract_word_text,
+        'doc': extract_word_text,
+        'xlsx': extract_spreadsheet_text,
+        'xls': extract_spreadsheet_text,
+        'pptx': extract_presentation_text,
+        'ppt': extract_presentation_text,
+        'rtf': extract_rtf_text,
+        'odt': reject_libreoffice_format,
+        'ods': reject_libreoffice_format,
+        'odp': reject_libreoffice_format,
+    }
+
+    extracted_text_cache = ExtractedTextCache()
 
     async def extract_text_from_file(filename: str, file_content: bytes) -> str:
         """Extract text from various file formats supported by LightRAG"""
         try:
-            file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
-            
-            # PDF files
-            if file_ext == 'pdf':
-                return extract_text_from_pdf_lightrag(file_content)
-            
-            # Plain text files
-            elif file_ext in ['txt', 'md', 'markdown', 'rst']:
-                return file_content.decode('utf-8')
-            
-            # CSV files
-            elif file_ext == 'csv':
-                return file_content.decode('utf-8')
-            
-            # JSON files
-            elif file_ext == 'json':
-                import json
-                json_data = json.loads(file_content.decode('utf-8'))
-                return json.dumps(json_data, indent=2)
-            
-            # XML/HTML files
-            elif file_ext in ['xml', 'html', 'htm']:
-                content = file_content.decode('utf-8')
-                try:
-                    from bs4 import BeautifulSoup
-                    if file_ext in ['html', 'htm']:
-                        soup = BeautifulSoup(content, 'html.parser')
-                        return soup.get_text(separator='\n', strip=True)
-                    else:
-                        soup = BeautifulSoup(content, 'xml')
-                        return soup.get_text(separator='\n', strip=True)
-                except ImportError:
-                    # Fallback to raw content if BeautifulSoup not available
-                    return content
-            
-            # Word documents
-            elif file_ext in ['docx', 'doc']:
-                try:
-                    import docx
-                    from io import BytesIO
-                    doc = docx.Document(BytesIO(file_content))
-                    content_parts = []
-                    for para in doc.paragraphs:
-                        text = para.text.strip()
-                        if text:
-                            content_parts.append(text)
-                    return "\n\n".join(content_parts)
-                except ImportError:
-                    logger.warning("python-docx not available, cannot process Word documents")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Word document processing requires python-docx library. Install with: pip install python-docx"
-                    )
-            
-            # Excel files
-            elif file_ext in ['xlsx', 'xls']:
-                try:
-                    import pandas as pd
-                    from io import BytesIO
-                    excel_file = pd.ExcelFile(BytesIO(file_content))
-                    content_parts = []
-                    for sheet_name in excel_file.sheet_names:
-                        df = pd.read_excel(BytesIO(file_content), sheet_name=sheet_name)
-                        content_parts.append(f"Sheet: {sheet_name}\n{df.to_string(index=False)}")
-                    return "\n\n" + "="*50 + "\n\n".join(content_parts)
-                except ImportError:
-                    logger.warning("pandas not available, cannot process Excel files")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Excel processing requires pandas and openpyxl libraries. Install with: pip install pandas openpyxl xlrd"
-                    )
-            
-            # PowerPoint files
-            elif file_ext in ['pptx', 'ppt']:
-                try:
-                    from pptx import Presentation
-                    from io import BytesIO
-                    prs = Presentation(BytesIO(file_content))
-                    content_parts = []
-                    for i, slide in enumerate(prs.slides):
-                        slide_text = []
-                        for shape in slide.shapes:
-                            if hasattr(shape, "text") and shape.text.strip():
-                                slide_text.append(shape.text)
-                        if slide_text:
-                            content_parts.append(f"--- Slide {i + 1} ---\n" + "\n".join(slide_text))
-                    return "\n\n".join(content_parts)
-                except ImportError:
-                    logger.warning("python-pptx not available, cannot process PowerPoint files")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="PowerPoint processing requires python-pptx library. Install with: pip install python-pptx"
-                    )
-            
-            # RTF files
-            elif file_ext == 'rtf':
-                try:
-                    from striprtf.striprtf import rtf_to_text
-                    rtf_content = file_content.decode('utf-8')
-                    return rtf_to_text(rtf_content)
-                except ImportError:
-                    logger.warning("striprtf not available, cannot process RTF files")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="RTF processing requires striprtf library. Install with: pip install striprtf"
-                    )
-            
-            # LibreOffice formats - basic support
-            elif file_ext in ['odt', 'ods', 'odp']:
-                logger.warning(f"LibreOffice format {file_ext} requires conversion to supported format")
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"LibreOffice {file_ext.upper()} files are not directly supported. Please convert to DOCX, PDF, or TXT format."
-                )
-            
-            # Use textract as fallback for other formats if available
+            _, dot, file_ext = filename.rpartition('.')
+            file_ext = file_ext.lower() if dot else ''
+            # hashlib releases the GIL, so hashing a large upload in a thread keeps the loop free
+            if len(file_content) >= DOCUMENT_PROCESS_MIN_BYTES:
+                cache_key = await asyncio.to_thread(ExtractedTextCache.make_key, file_ext, file_content)
             else:
-                try:
-                    import textract
-                    from tempfile import NamedTemporaryFile
-                    import os
-                    
-                    # Create temporary file
-                    with NamedTemporaryFile(suffix=f'.{file_ext}', delete=False) as temp_file:
-                        temp_file.write(file_content)
-                        temp_file.flush()
-                        
-                        try:
-                            # Use textract to extract text
-                            extracted_text = textract.process(temp_file.name)
-                            return extracted_text.decode('utf-8')
-                        finally:
-                            # Clean up temporary file
-                            os.unlink(temp_file.name)
-                            
-                except ImportError:
-                    logger.warning("textract not available for additional format support")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Unsupported file type: {filename}. Supported formats: PDF, TXT, MD, CSV, JSON, XML, HTML, DOCX, DOC, XLSX, XLS, PPTX, PPT, RTF. For more formats, install: pip install textract"
-                    )
-                except Exception as e:
-                    logger.error(f"Error processing file with textract: {e}")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Error processing file {filename}: {str(e)}"
-                    )
+                cache_key = ExtractedTextCache.make_key(file_ext, file_content)
+            text = extracted_text_cache.get(cache_key)
+            if text is not None:
+                logger.info(f"Reusing extracted text for {filename}")
+                return text
+            
+            extractor = FILE_TEXT_EXTRACTORS.get(file_ext)
+            if extractor is None:
+                text = await extract_textract_text(filename, file_ext, file_content)
+            else:
+                text = await extractor(file_ext, file_content)
+            extracted_text_cache.put(cache_key, text)
+            return text
         
         except HTTPException:
             # Re-raise HTTP exceptions as-is
@@ -625,165 +1274,282 @@ if LIGHTRAG_AVAILABLE:
                 status_code=500, 
                 detail=f"Unexpected error processing file: {str(e)}"
             )
-        """Extract text from various file formats supported by LightRAG"""
-        try:
-            file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
-            
-            # PDF files
-            if file_ext == 'pdf':
-                return extract_text_from_pdf_lightrag(file_content)
-            
-            # Plain text files
-            elif file_ext in ['txt', 'md', 'markdown', 'rst']:
-                return file_content.decode('utf-8')
-            
-            # CSV files
-            elif file_ext == 'csv':
-                return file_content.decode('utf-8')
+
+    # Batches go out back to back; only a provider that reports rate limiting gets an
+    # exponentially growing pause before the batch is retried
+    EMBEDDING_RATE_LIMIT_RETRIES = 5
+    EMBEDDING_RATE_LIMIT_INITIAL_DELAY = 0.5
+    EMBEDDING_RATE_LIMIT_MAX_DELAY = 5.0
+
+    async def embed_with_rate_limit_backoff(embed_func, texts: list[str]):
+        """Call embed_func, backing off and retrying while the provider is rate limiting"""
+        delay = EMBEDDING_RATE_LIMIT_INITIAL_DELAY
+        for attempt in range(EMBEDDING_RATE_LIMIT_RETRIES):
+            try:
+                return await embed_func(texts)
+            except Exception as e:
+                error_str = str(e).lower()
+                if '429' not in error_str and 'rate limit' not in error_str:
+                    raise
+                logger.warning(f"Embedding provider is rate limiting (attempt {attempt + 1}/{EMBEDDING_RATE_LIMIT_RETRIES}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, EMBEDDING_RATE_LIMIT_MAX_DELAY)
+        return await embed_func(texts)
+
+    async def batch_embed_texts(texts: list[str], batch_size: int, embed_func):
+        """Process texts in batches to avoid size limits"""
+        if len(texts) <= batch_size:
+            return await embed_with_rate_limit_backoff(embed_func, texts)
+        
+        all_embeddings = []
+        total_batches = (len(texts) + batch_size - 1) // batch_size
+        
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i:i + batch_size]
+            batch_num = (i // batch_size) + 1
             
-            # JSON files
-            elif file_ext == 'json':
-                import json
-                json_data = json.loads(file_content.decode('utf-8'))
-                return json.dumps(json_data, indent=2)
+            # Log batch details for debugging
+            batch_sizes = [len(text) for text in batch]
+            logger.info(f"Processing embedding batch {batch_num}/{total_batches} ({len(batch)} texts, sizes: {batch_sizes})")
             
-            # XML/HTML files
-            elif file_ext in ['xml', 'html', 'htm']:
-                content = file_content.decode('utf-8')
-                try:
-                    from bs4 import BeautifulSoup
-                    if file_ext in ['html', 'htm']:
-                        soup = BeautifulSoup(content, 'html.parser')
-                        return soup.get_text(separator='\n', strip=True)
+            try:
+                batch_embeddings = await embed_with_rate_limit_backoff(embed_func, batch)
+                all_embeddings.extend(batch_embeddings)
+                logger.info(f"✅ Batch {batch_num} successful: {len(batch_embeddings)} embeddings")
+                    
+            except Exception as e:
+                error_str = str(e).lower()
+                logger.error(f"❌ Batch {batch_num} failed: {str(e)}")
+                
+                if ('too large' in error_str or 'batch size' in error_str or 
+                    'input is too large' in error_str):
+                    if batch_size > 1:
+                        # Recursively reduce batch size if still too large
+                        logger.warning(f"Batch size {batch_size} too large, reducing to {batch_size // 2}")
+                        return await batch_embed_texts(texts, batch_size // 2, embed_func)
                     else:
-                        soup = BeautifulSoup(content, 'xml')
-                        return soup.get_text(separator='\n', strip=True)
-                except ImportError:
-                    # Fallback to raw content if BeautifulSoup not available
-                    return content
-            
-            # Word documents
-            elif file_ext in ['docx', 'doc']:
-                try:
-                    import docx
-                    from io import BytesIO
-                    doc = docx.Document(BytesIO(file_content))
-                    content_parts = []
-                    for para in doc.paragraphs:
-                        text = para.text.strip()
-                        if text:
-                            content_parts.append(text)
-                    return "\n\n".join(content_parts)
-                except ImportError:
-                    logger.warning("python-docx not available, cannot process Word documents")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Word document processing requires python-docx library"
-                    )
-            
-            # Excel files
-            elif file_ext in ['xlsx', 'xls']:
-                try:
-                    import pandas as pd
-                    from io import BytesIO
-                    excel_file = pd.ExcelFile(BytesIO(file_content))
-                    content_parts = []
-                    for sheet_name in excel_file.sheet_names:
-                        df = pd.read_excel(BytesIO(file_content), sheet_name=sheet_name)
-                        content_parts.append(f"Sheet: {sheet_name}\n{df.to_string(index=False)}")
-                    return "\n\n" + "="*50 + "\n\n".join(content_parts)
-                except ImportError:
-                    logger.warning("pandas not available, cannot process Excel files")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Excel processing requires pandas and openpyxl libraries"
-                    )
-            
-            # PowerPoint files
-            elif file_ext in ['pptx', 'ppt']:
-                try:
-                    from pptx import Presentation
-                    from io import BytesIO
-                    prs = Presentation(BytesIO(file_content))
-                    content_parts = []
-                    for i, slide in enumerate(prs.slides):
-                        slide_text = []
-                        for shape in slide.shapes:
-                            if hasattr(shape, "text") and shape.text.strip():
-                                slide_text.append(shape.text)
-                        if slide_text:
-                            content_parts.append(f"--- Slide {i + 1} ---\n" + "\n".join(slide_text))
-                    return "\n\n".join(content_parts)
-                except ImportError:
-                    logger.warning("python-pptx not available, cannot process PowerPoint files")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="PowerPoint processing requires python-pptx library"
-                    )
-            
-            # RTF files
-            elif file_ext == 'rtf':
-                try:
-                    from striprtf.striprtf import rtf_to_text
-                    rtf_content = file_content.decode('utf-8')
-                    return rtf_to_text(rtf_content)
-                except ImportError:
-                    logger.warning("striprtf not available, cannot process RTF files")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="RTF processing requires striprtf library"
-                    )
-            
-            # LibreOffice formats - basic support
-            elif file_ext in ['odt', 'ods', 'odp']:
-                logger.warning(f"LibreOffice format {file_ext} requires conversion to supported format")
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"LibreOffice {file_ext.upper()} files are not directly supported. Please convert to DOCX, PDF, or TXT format."
+                        # If batch size is 1 and still fails, check if we can chunk the text further
+                        if len(batch) == 1 and len(batch[0]) > 200:
+                            logger.warning(f"Individual text too large ({len(batch[0])} chars), attempting to chunk further")
+                            # Split the large text into smaller pieces, slicing each one only as it's sent
+                            large_text = batch[0]
+                            chunk_offsets = range(0, len(large_text), 180)  # 20 char overlap
+                            logger.info(f"Split text into {len(chunk_offsets)} smaller chunks")
+                            
+                            # Try to embed the chunks individually
+                            chunk_embeddings = []
+                            for chunk in (large_text[j:j+200] for j in chunk_offsets):
+                                try:
+                                    chunk_result = await embed_func([chunk])
+                                    chunk_embeddings.extend(chunk_result)
+                                except Exception as chunk_error:
+                                    logger.error(f"Even small chunk failed ({len(chunk)} chars): {chunk_error}")
+                                    raise Exception(f"Text cannot be embedded even after chunking: {str(chunk_error)}")
+                            
+                            all_embeddings.extend(chunk_embeddings)
+                            logger.info(f"✅ Successfully processed large text via chunking: {len(chunk_embeddings)} embeddings")
+                        else:
+                            logger.error(f"Individual text too large for embedding: {len(batch[0])} characters")
+                            raise Exception(f"Text too large for embedding (batch size 1 failed): {str(e)}")
+                else:
+                    # Re-raise non-batch-size errors
+                    raise e
+        
+        return all_embeddings
+
+    @lru_cache(maxsize=64)
+    def get_llm_model_func(llm_provider_type: str, llm_model_name: str, llm_api_key: str, llm_base_url: str):
+        """Build the LightRAG LLM function and kwargs for a provider, once per provider config"""
+        if llm_provider_type == 'openai':
+            llm_model_func = gpt_4o_mini_complete if 'gpt-4o-mini' in llm_model_name else openai_complete
+            llm_model_kwargs = {
+                "api_key": llm_api_key.strip(),
+            }
+        elif llm_provider_type == 'openai_compatible':
+            # Create wrapper function for openai_complete_if_cache
+            async def llm_model_func(
+                prompt, system_prompt=None, history_messages=[], keyword_extraction=False, **kwargs
+            ) -> str:
+                return await openai_complete_if_cache(
+                    llm_model_name,
+                    prompt,
+                    system_prompt=system_prompt,
+                    history_messages=history_messages,
+                    api_key=llm_api_key.strip(),
+                    base_url=llm_base_url,
+                    **kwargs,
+                )
+            llm_model_kwargs = {}
+        elif llm_provider_type == 'ollama':
+            llm_model_func = ollama_model_complete
+            llm_model_kwargs = {
+                "host": llm_base_url if llm_base_url else "http://localhost:11434",
+                "options": {"num_ctx": 8192},
+                "timeout": 300,
+            }
+        else:
+            raise ValueError(f"Unsupported LLM provider type: {llm_provider_type}")
+        
+        return llm_model_func, llm_model_kwargs
+
+    @lru_cache(maxsize=64)
+    def get_embedding_model_func(embedding_provider_type: str, embedding_model_name: str, embedding_api_key: str,
+                                 embedding_base_url: str, is_clara_core_embedding: bool):
+        """Build the embedding function for a provider, once per provider config (following LightRAG documentation pattern)"""
+        if embedding_provider_type == 'openai':
+            async def base_openai_embed(texts: list[str]):
+                return await pooled_openai_embed(
+                    texts,
+                    model=embedding_model_name,
+                    api_key=embedding_api_key.strip()
                 )
             
-            # Use textract as fallback for other formats if available
-            else:
-                try:
-                    import textract
-                    from tempfile import NamedTemporaryFile
-                    
-                    # Create temporary file
-                    with NamedTemporaryFile(suffix=f'.{file_ext}', delete=False) as temp_file:
-                        temp_file.write(file_content)
-                        temp_file.flush()
+            async def embedding_func_lambda(texts: list[str]):
+                # Use smaller batch size for OpenAI; rate limiting is handled by the 429 backoff
+                batch_size = 16 if len(texts) > 16 else len(texts)
+                return await batch_embed_texts(texts, batch_size, base_openai_embed)
+                
+        elif embedding_provider_type == 'openai_compatible':
+            # Special handling for Clara Core embedding models
+            model_to_use = embedding_model_name
+            stripped_embedding_api_key = embedding_api_key.strip()
+            
+            # Retry logic for Clara Core (models need time to load into RAM)
+            max_retries = 5 if is_clara_core_embedding else 2
+            retry_delay = 10 if is_clara_core_embedding else 3  # seconds
+            request_timeout = 180 if is_clara_core_embedding else 60  # seconds
+            
+            async def base_openai_compatible_embed(texts: list[str]):
+                for attempt in range(max_retries):
+                    try:
+                        logger.info(f"Embedding attempt {attempt + 1}/{max_retries} for {model_to_use} ({len(texts)} texts)")
                         
-                        try:
-                            # Use textract to extract text
-                            extracted_text = textract.process(temp_file.name)
-                            return extracted_text.decode('utf-8')
-                        finally:
-                            # Clean up temporary file
-                            import os
-                            os.unlink(temp_file.name)
-                            
-                except ImportError:
-                    logger.warning("textract not available for additional format support")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Unsupported file type: {filename}. Supported formats: PDF, TXT, MD, CSV, JSON, XML, HTML, DOCX, DOC, XLSX, XLS, PPTX, PPT, RTF"
-                    )
-                except Exception as e:
-                    logger.error(f"Error processing file with textract: {e}")
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Error processing file {filename}: {str(e)}"
-                    )
+                        # Use asyncio timeout for the request
+                        result = await asyncio.wait_for(
+                            pooled_openai_embed(
+                                texts,
+                                model=model_to_use,
+                                api_key=stripped_embedding_api_key,
+                                base_url=embedding_base_url
+                            ),
+                            timeout=request_timeout
+                        )
+                        
+                        logger.info(f"Successfully generated {len(result)} embeddings with {model_to_use}")
+                        return result
+                        
+                    except asyncio.TimeoutError:
+                        if attempt < max_retries - 1:
+                            logger.warning(f"Embedding request timed out (attempt {attempt + 1}/{max_retries}), retrying in {retry_delay}s...")
+                            await asyncio.sleep(retry_delay)
+                            continue
+                        else:
+                            error_msg = f"Embedding request timed out after {max_retries} attempts. Clara Core server may need more time to load the model."
+                            logger.error(error_msg)
+                            raise Exception(error_msg)
+                    except Exception as e:
+                        error_str = str(e).lower()
+                        if attempt < max_retries - 1:
+                            # Retry for certain types of errors that might resolve with time
+                            if any(keyword in error_str for keyword in ['connection', 'timeout', 'loading', 'model']):
+                                logger.warning(f"Embedding failed (attempt {attempt + 1}/{max_retries}): {e}")
+                                logger.info(f"Retrying in {retry_delay}s... (Clara Core may be loading model)")
+                                await asyncio.sleep(retry_delay)
+                                continue
+                            else:
+                                # Check if it's a batch size error
+                                if 'too large' in error_str or 'batch size' in error_str:
+                                    logger.warning(f"Batch size error detected: {e}")
+                                    raise e  # Let the batching function handle this
+                                # Don't retry for authentication or other permanent errors
+                                raise e
+                        else:
+                            logger.error(f"Embedding failed after {max_retries} attempts: {e}")
+                            raise e
+
+            # Use very conservative batch size for Clara Core based on testing
+            # Clara Core with e5-large-v2-q4-0 has strict limits ~500 chars per text
+            async def clara_core_embed(texts: list[str]):
+                # For Clara Core, split large texts into chunks, embed the chunks of every
+                # text in shared batches, then average each text's chunk embeddings
+                all_chunks = []
+                chunk_slots = []
+                
+                for text in texts:
+                    if len(text) > 400:  # Conservative limit for Clara Core
+                        chunks = [text[i:i+400] for i in range(0, len(text), 350)]  # 50 char overlap
+                        logger.info(f"Split large text ({len(text)} chars) into {len(chunks)} chunks for Clara Core")
+                    else:
+                        chunks = [text]
+                    chunk_slots.append((len(all_chunks), len(all_chunks) + len(chunks)))
+                    all_chunks.extend(chunks)
+                
+                # batch_embed_texts halves the batch size if the server rejects it as too large
+                chunk_embeddings = np.asarray(
+                    await batch_embed_texts(all_chunks, CLARA_CORE_EMBEDDING_BATCH_SIZE, base_openai_compatible_embed),
+                    dtype=np.float32
+                )
+                return np.stack([chunk_embeddings[start:end].mean(axis=0) for start, end in chunk_slots])
+            
+            # Caps in-flight sub-batches across every instance using this provider
+            embedding_semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENT_BATCHES)
+            
+            async def embed_sub_batch(texts: list[str]):
+                # For other OpenAI-compatible APIs, use larger batch size
+                batch_size = min(16, len(texts)) if len(texts) > 0 else 1
+                async with embedding_semaphore:
+                    return await batch_embed_texts(texts, batch_size, base_openai_compatible_embed)
+            
+            async def batched_openai_compatible_embed(texts: list[str]):
+                if len(texts) <= EMBEDDING_SUB_BATCH_SIZE:
+                    return await embed_sub_batch(texts)
+                parts = await asyncio.gather(*[
+                    embed_sub_batch(texts[i:i + EMBEDDING_SUB_BATCH_SIZE])
+                    for i in range(0, len(texts), EMBEDDING_SUB_BATCH_SIZE)
+                ])
+                return np.array([embedding for part in parts for embedding in part])
+            
+            # Pick the embedding path once instead of on every call
+            embedding_func_lambda = clara_core_embed if is_clara_core_embedding else batched_openai_compatible_embed
+                
+        elif embedding_provider_type == 'ollama':
+            async def base_ollama_embed(texts: list[str]):
+                return await pooled_ollama_embed(
+                    texts,
+                    embed_model=embedding_model_name,
+                    host=embedding_base_url if embedding_base_url else "http://localhost:11434"
+                )
+            
+            # Batch size adapts to the Ollama server's observed throughput
+            ollama_batcher = OllamaBatcher(base_ollama_embed)
+            
+            async def embedding_func_lambda(texts: list[str]):
+                return await ollama_batcher.embed(texts)
+        else:
+            raise ValueError(f"Unsupported embedding provider type: {embedding_provider_type}")
         
-        except HTTPException:
-            # Re-raise HTTP exceptions as-is
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error processing file {filename}: {e}")
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Unexpected error processing file: {str(e)}"
-            )
+        return embedding_func_lambda
+
+    # Embedding dimensions by model name fragment; the first fragment found in the model name wins
+    EMBEDDING_MODEL_DIMS = (
+        ('mxbai-embed-large', 1024),
+        ('e5-large-v2', 1024),
+        ('text-embedding-3-small', 1536),
+        ('text-embedding-3-large', 3072),
+        ('all-MiniLM-L6-v2', 384),
+        ('nomic-embed', 768),
+        ('bge-m3', 1024),
+    )
+    DEFAULT_EMBEDDING_DIM = 1536  # OpenAI ada-002
+
+    @lru_cache(maxsize=64)
+    def get_embedding_dim(embedding_model_name: str) -> int:
+        """Look up the embedding dimension for a model name"""
+        return next((dim for fragment, dim in EMBEDDING_MODEL_DIMS if fragment in embedding_model_name), DEFAULT_EMBEDDING_DIM)
+
+    # Clara Core serves its OpenAI-compatible API on port 8091 and needs no API key;
+    # match the port itself, not ':8091' anywhere in the URL
+    CLARA_CORE_URL_RE = re.compile(r':8091(?:/|$)')
 
     async def create_lightrag_instance(notebook_id: str, llm_provider_config: Dict[str, Any], embedding_provider_config: Dict[str, Any]) -> LightRAG:
         """Create a new LightRAG instance for a notebook with specified provider configurations"""
@@ -817,8 +1583,8 @@ if LIGHTRAG_AVAILABLE:
                 embedding_base_url = embedding_base_url[:-3]
             
             # Validate API keys for non-Ollama providers (except Clara Core on port 8091)
-            is_clara_core_llm = ':8091' in llm_base_url or llm_base_url.endswith(':8091')
-            is_clara_core_embedding = ':8091' in embedding_base_url or embedding_base_url.endswith(':8091')
+            is_clara_core_llm = CLARA_CORE_URL_RE.search(llm_base_url) is not None
+            is_clara_core_embedding = CLARA_CORE_URL_RE.search(embedding_base_url) is not None
             
             if llm_provider_type != 'ollama' and not is_clara_core_llm and (not llm_api_key or llm_api_key.strip() == 'your-api-key'):
                 raise ValueError(f"Invalid or missing LLM API key for provider type: {llm_provider_type}")
@@ -834,239 +1600,16 @@ if LIGHTRAG_AVAILABLE:
                 logger.info("Using Clara Core embedding - no API key required")
             
             # Determine embedding dimensions based on the embedding model
-            embedding_dim = 1536  # Default for OpenAI ada-002
-            if 'mxbai-embed-large' in embedding_model_name:
-                embedding_dim = 1024
-            elif 'e5-large-v2' in embedding_model_name:
-                embedding_dim = 1024  # e5-large-v2 produces 1024-dimensional embeddings
-            elif 'text-embedding-3-small' in embedding_model_name:
-                embedding_dim = 1536
-            elif 'text-embedding-3-large' in embedding_model_name:
-                embedding_dim = 3072
-            elif 'all-MiniLM-L6-v2' in embedding_model_name:
-                embedding_dim = 384
-            elif 'nomic-embed' in embedding_model_name:
-                embedding_dim = 768
-            elif 'bge-m3' in embedding_model_name:
-                embedding_dim = 1024
+            embedding_dim = get_embedding_dim(embedding_model_name)
             
             logger.info(f"Using embedding dimension: {embedding_dim}")
             
-            # Set up LLM function and parameters based on provider type
-            if llm_provider_type == 'openai':
-                llm_model_func = gpt_4o_mini_complete if 'gpt-4o-mini' in llm_model_name else openai_complete
-                llm_model_kwargs = {
-                    "api_key": llm_api_key.strip(),
-                }
-            elif llm_provider_type == 'openai_compatible':
-                # Create wrapper function for openai_complete_if_cache
-                async def llm_model_func(
-                    prompt, system_prompt=None, history_messages=[], keyword_extraction=False, **kwargs
-                ) -> str:
-                    return await openai_complete_if_cache(
-                        llm_model_name,
-                        prompt,
-                        system_prompt=system_prompt,
-                        history_messages=history_messages,
-                        api_key=llm_api_key.strip(),
-                        base_url=llm_base_url,
-                        **kwargs,
-                    )
-                llm_model_kwargs = {}
-            elif llm_provider_type == 'ollama':
-                llm_model_func = ollama_model_complete
-                llm_model_kwargs = {
-                    "host": llm_base_url if llm_base_url else "http://localhost:11434",
-                    "options": {"num_ctx": 8192},
-                    "timeout": 300,
-                }
-            else:
-                raise ValueError(f"Unsupported LLM provider type: {llm_provider_type}")
-            
-            # Helper function to batch texts for embedding
-            async def batch_embed_texts(texts: list[str], batch_size: int, embed_func):
-                """Process texts in batches to avoid size limits"""
-                if len(texts) <= batch_size:
-                    return await embed_func(texts)
-                
-                all_embeddings = []
-                total_batches = (len(texts) + batch_size - 1) // batch_size
-                
-                for i in range(0, len(texts), batch_size):
-                    batch = texts[i:i + batch_size]
-                    batch_num = (i // batch_size) + 1
-                    
-                    # Log batch details for debugging
-                    batch_sizes = [len(text) for text in batch]
-                    logger.info(f"Processing embedding batch {batch_num}/{total_batches} ({len(batch)} texts, sizes: {batch_sizes})")
-                    
-                    try:
-                        batch_embeddings = await embed_func(batch)
-                        all_embeddings.extend(batch_embeddings)
-                        logger.info(f"✅ Batch {batch_num} successful: {len(batch_embeddings)} embeddings")
-                        
-                        # Small delay between batches to be respectful to the API
-                        if i + batch_size < len(texts):
-                            await asyncio.sleep(0.5)
-                            
-                    except Exception as e:
-                        error_str = str(e).lower()
-                        logger.error(f"❌ Batch {batch_num} failed: {str(e)}")
-                        
-                        if ('too large' in error_str or 'batch size' in error_str or 
-                            'input is too large' in error_str):
-                            if batch_size > 1:
-                                # Recursively reduce batch size if still too large
-                                logger.warning(f"Batch size {batch_size} too large, reducing to {batch_size // 2}")
-                                return await batch_embed_texts(texts, batch_size // 2, embed_func)
-                            else:
-                                # If batch size is 1 and still fails, check if we can chunk the text further
-                                if len(batch) == 1 and len(batch[0]) > 200:
-                                    logger.warning(f"Individual text too large ({len(batch[0])} chars), attempting to chunk further")
-                                    # Split the large text into smaller pieces
-                                    large_text = batch[0]
-                                    chunks = [large_text[j:j+200] for j in range(0, len(large_text), 180)]  # 20 char overlap
-                                    logger.info(f"Split text into {len(chunks)} smaller chunks")
-                                    
-                                    # Try to embed the chunks individually
-                                    chunk_embeddings = []
-                                    for chunk in chunks:
-                                        try:
-                                            chunk_result = await embed_func([chunk])
-                                            chunk_embeddings.extend(chunk_result)
-                                        except Exception as chunk_error:
-                                            logger.error(f"Even small chunk failed ({len(chunk)} chars): {chunk_error}")
-                                            raise Exception(f"Text cannot be embedded even after chunking: {str(chunk_error)}")
-                                    
-                                    all_embeddings.extend(chunk_embeddings)
-                                    logger.info(f"✅ Successfully processed large text via chunking: {len(chunk_embeddings)} embeddings")
-                                else:
-                                    logger.error(f"Individual text too large for embedding: {len(batch[0])} characters")
-                                    raise Exception(f"Text too large for embedding (batch size 1 failed): {str(e)}")
-                        else:
-                            # Re-raise non-batch-size errors
-                            raise e
-                
-                return all_embeddings
-
-            # Set up embedding function based on provider type (following LightRAG documentation pattern)
-            if embedding_provider_type == 'openai':
-                async def base_openai_embed(texts: list[str]):
-                    return await openai_embed(
-                        texts,
-                        model=embedding_model_name,
-                        api_key=embedding_api_key.strip()
-                    )
-                
-                async def embedding_func_lambda(texts: list[str]):
-                    # Use smaller batch size for OpenAI to avoid rate limits
-                    batch_size = 16 if len(texts) > 16 else len(texts)
-                    return await batch_embed_texts(texts, batch_size, base_openai_embed)
-                    
-            elif embedding_provider_type == 'openai_compatible':
-                # Special handling for Clara Core embedding models
-                model_to_use = embedding_model_name
-                
-                async def base_openai_compatible_embed(texts: list[str]):
-                    # Retry logic for Clara Core (models need time to load into RAM)
-                    max_retries = 5 if is_clara_core_embedding else 2
-                    retry_delay = 10 if is_clara_core_embedding else 3  # seconds
-                    request_timeout = 180 if is_clara_core_embedding else 60  # seconds
-                    
-                    for attempt in range(max_retries):
-                        try:
-                            logger.info(f"Embedding attempt {attempt + 1}/{max_retries} for {model_to_use} ({len(texts)} texts)")
-                            
-                            # Use asyncio timeout for the request
-                            result = await asyncio.wait_for(
-                                openai_embed(
-                                    texts,
-                                    model=model_to_use,
-                                    api_key=embedding_api_key.strip(),
-                                    base_url=embedding_base_url
-                                ),
-                                timeout=request_timeout
-                            )
-                            
-                            logger.info(f"Successfully generated {len(result)} embeddings with {model_to_use}")
-                            return result
-                            
-                        except asyncio.TimeoutError:
-                            if attempt < max_retries - 1:
-                                logger.warning(f"Embedding request timed out (attempt {attempt + 1}/{max_retries}), retrying in {retry_delay}s...")
-                                await asyncio.sleep(retry_delay)
-                                continue
-                            else:
-                                error_msg = f"Embedding request timed out after {max_retries} attempts. Clara Core server may need more time to load the model."
-                                logger.error(error_msg)
-                                raise Exception(error_msg)
-                        except Exception as e:
-                            error_str = str(e).lower()
-                            if attempt < max_retries - 1:
-                                # Retry for certain types of errors that might resolve with time
-                                if any(keyword in error_str for keyword in ['connection', 'timeout', 'loading', 'model']):
-                                    logger.warning(f"Embedding failed (attempt {attempt + 1}/{max_retries}): {e}")
-                                    logger.info(f"Retrying in {retry_delay}s... (Clara Core may be loading model)")
-                                    await asyncio.sleep(retry_delay)
-                                    continue
-                                else:
-                                    # Check if it's a batch size error
-                                    if 'too large' in error_str or 'batch size' in error_str:
-                                        logger.warning(f"Batch size error detected: {e}")
-                                        raise e  # Let the batching function handle this
-                                    # Don't retry for authentication or other permanent errors
-                                    raise e
-                            else:
-                                logger.error(f"Embedding failed after {max_retries} attempts: {e}")
-                                raise e
-
-                async def embedding_func_lambda(texts: list[str]):
-                    # Use very conservative batch size for Clara Core based on testing
-                    # Clara Core with e5-large-v2-q4-0 has strict limits ~500 chars per text
-                    if is_clara_core_embedding:
-                        # For Clara Core, process each text individually and aggregate chunks
-                        final_embeddings = []
-                        
-                        for text in texts:
-                            if len(text) > 400:  # Conservative limit for Clara Core
-                                # Split large texts into smaller chunks
-                                chunks = [text[i:i+400] for i in range(0, len(text), 350)]  # 50 char overlap
-                                logger.info(f"Split large text ({len(text)} chars) into {len(chunks)} chunks for Clara Core")
-                                
-                                # Get embeddings for all chunks
-                                chunk_embeddings = await batch_embed_texts(chunks, 1, base_openai_compatible_embed)
-                                
-                                # Aggregate chunk embeddings by averaging
-                                import numpy as np
-                                chunk_array = np.array(chunk_embeddings)
-                                aggregated_embedding = np.mean(chunk_array, axis=0).tolist()
-                                final_embeddings.append(aggregated_embedding)
-                                logger.info(f"Aggregated {len(chunks)} chunk embeddings into single embedding")
-                            else:
-                                # Small text, process directly
-                                single_embedding = await batch_embed_texts([text], 1, base_openai_compatible_embed)
-                                final_embeddings.extend(single_embedding)
-                        
-                        return final_embeddings
-                    else:
-                        # For other OpenAI-compatible APIs, use larger batch size
-                        batch_size = min(16, len(texts)) if len(texts) > 0 else 1
-                        return await batch_embed_texts(texts, batch_size, base_openai_compatible_embed)
-                    
-            elif embedding_provider_type == 'ollama':
-                async def base_ollama_embed(texts: list[str]):
-                    return await ollama_embed(
-                        texts,
-                        embed_model=embedding_model_name,
-                        host=embedding_base_url if embedding_base_url else "http://localhost:11434"
-                    )
-                
-                async def embedding_func_lambda(texts: list[str]):
-                    # Use smaller batch size for Ollama to avoid memory issues
-                    batch_size = 4 if len(texts) > 4 else len(texts)
-                    return await batch_embed_texts(texts, batch_size, base_ollama_embed)
-            else:
-                raise ValueError(f"Unsupported embedding provider type: {embedding_provider_type}")
+            # LLM and embedding functions are shared by every instance using the same provider
+            llm_model_func, llm_model_kwargs = get_llm_model_func(llm_provider_type, llm_model_name, llm_api_key.strip(), llm_base_url)
+            llm_model_kwargs = dict(llm_model_kwargs)
+            embedding_func_lambda = get_embedding_model_func(
+                embedding_provider_type, embedding_model_name, embedding_api_key.strip(), embedding_base_url, is_clara_core_embedding
+            )
             
             # Determine if using local/ollama providers for optimized configuration
             is_local_llm = llm_provider_type == 'ollama'
@@ -1135,8 +1678,7 @@ if LIGHTRAG_AVAILABLE:
             logger.error(f"Configuration error for notebook {notebook_id}: {ve}")
             raise HTTPException(status_code=400, detail=f"Configuration error: {str(ve)}")
         except Exception as e:
-            logger.error(f"Error creating LightRAG instance for notebook {notebook_id}: {e}")
-            logger.error(f"Full traceback: {traceback.format_exc()}")
+            logger.exception(f"Error creating LightRAG instance for notebook {notebook_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error initializing RAG system: {str(e)}")
 
     async def get_lightrag_instance(notebook_id: str) -> LightRAG:
@@ -1149,6 +1691,71 @@ if LIGHTRAG_AVAILABLE:
         
         return lightrag_instances[notebook_id]
 
+    # RAG instances for queries that override the LLM provider, reused across requests
+    # and keyed by notebook plus a hash of the provider configs (least recently used first)
+    OVERRIDE_RAG_CACHE_SIZE = 8
+    OVERRIDE_RAG_IDLE_SECONDS = 600
+    override_rag_cache: "OrderedDict[tuple, List[Any]]" = OrderedDict()
+    override_rag_sweep_task: Optional[asyncio.Task] = None
+
+    def hash_provider_config(provider_config: Dict[str, Any]) -> str:
+        """Hash a provider config for use in a cache key"""
+        return hashlib.sha1(json.dumps(provider_config, sort_keys=True, default=str).encode()).hexdigest()
+
+    async def close_override_rag(rag: LightRAG):
+        """Release an override RAG instance's storages, logging instead of raising on failure"""
+        finalize = getattr(rag, "finalize_storages", None)
+        if finalize is None:
+            return
+        try:
+            await finalize()
+        except Exception as e:
+            logger.warning(f"Error closing override RAG instance: {e}")
+
+    async def get_override_rag_instance(notebook_id: str, llm_provider: Dict[str, Any], embedding_provider: Dict[str, Any]) -> LightRAG:
+        """Get or create a RAG instance for a notebook queried with an overriding LLM provider"""
+        key = (notebook_id, hash_provider_config(llm_provider), hash_provider_config(embedding_provider))
+        entry = override_rag_cache.get(key)
+        if entry is not None:
+            override_rag_cache.move_to_end(key)
+            entry[1] = time.monotonic()
+            return entry[0]
+        
+        rag = await create_lightrag_instance(f"{notebook_id}_temp", llm_provider, embedding_provider)
+        override_rag_cache[key] = [rag, time.monotonic()]
+        while len(override_rag_cache) > OVERRIDE_RAG_CACHE_SIZE:
+            _, (evicted_rag, _) = override_rag_cache.popitem(last=False)
+            await close_override_rag(evicted_rag)
+        return rag
+
+    async def evict_override_rags(notebook_id: Optional[str] = None, idle_seconds: Optional[float] = None):
+        """Drop cached override RAG instances for a notebook, or those idle longer than idle_seconds"""
+        now = time.monotonic()
+        for key, (rag, last_used) in list(override_rag_cache.items()):
+            if notebook_id is not None and key[0] != notebook_id:
+                continue
+            if idle_seconds is not None and now - last_used <= idle_seconds:
+                continue
+            del override_rag_cache[key]
+            await close_override_rag(rag)
+
+    async def sweep_override_rags():
+        """Periodically drop override RAG instances that haven't been used recently"""
+        while True:
+            await asyncio.sleep(60)
+            await evict_override_rags(idle_seconds=OVERRIDE_RAG_IDLE_SECONDS)
+
+    @app.on_event("startup")
+    async def start_override_rag_sweep():
+        global override_rag_sweep_task
+        override_rag_sweep_task = asyncio.create_task(sweep_override_rags())
+
+    @app.on_event("shutdown")
+    async def stop_override_rag_sweep():
+        if override_rag_sweep_task:
+            override_rag_sweep_task.cancel()
+        await evict_override_rags()
+
     def auto_detect_provider_type(provider_config: Dict[str, Any]) -> Dict[str, Any]:
         """Auto-detect provider type based on baseUrl and return updated config"""
         provider_config = provider_config.copy()  # Don't modify original
@@ -1171,13 +1778,205 @@ if LIGHTRAG_AVAILABLE:
         if notebook_id not in lightrag_notebooks_db:
             raise HTTPException(status_code=404, detail="Notebook not found")
 
-    async def process_notebook_document_with_delay(notebook_id: str, document_id: str, text_content: str, delay_seconds: int):
-        """Wrapper to add delay before processing document"""
-        if delay_seconds > 0:
-            await asyncio.sleep(delay_seconds)
+    # Bounds for LightRAG queries so a hung upstream LLM can't pin a request forever
+    QUERY_TIMEOUT_SECONDS = float(os.getenv("CLARA_QUERY_TIMEOUT", "300"))
+    QUERY_MAX_ATTEMPTS = 3
+    QUERY_RETRY_DELAY_SECONDS = 2
+    RETRYABLE_QUERY_ERRORS = ['connection', 'rate limit', '429', '502', '503', 'temporarily unavailable']
+
+    # Small models that need a reduced retrieval context, and errors that mean the context overflowed
+    SMALL_MODEL_RE = re.compile(r'gemma|llama.*\b[347]b\b')
+    CONTEXT_ERR_RE = re.compile(r'context size|context length|token limit|exceeds|too long')
+
+    async def run_rag_query(rag: LightRAG, question: str, param: QueryParam) -> str:
+        """Run rag.aquery with a timeout, retrying transient upstream errors"""
+        for attempt in range(QUERY_MAX_ATTEMPTS):
+            try:
+                return await asyncio.wait_for(rag.aquery(question, param=param), timeout=QUERY_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.error(f"Query timed out after {QUERY_TIMEOUT_SECONDS:.0f}s")
+                raise HTTPException(
+                    status_code=504,
+                    detail=f"Query timed out after {QUERY_TIMEOUT_SECONDS:.0f} seconds. The LLM provider may be overloaded or unreachable."
+                )
+            except Exception as e:
+                error_str = str(e).lower()
+                if attempt < QUERY_MAX_ATTEMPTS - 1 and any(keyword in error_str for keyword in RETRYABLE_QUERY_ERRORS):
+                    logger.warning(f"Query failed (attempt {attempt + 1}/{QUERY_MAX_ATTEMPTS}): {e}, retrying in {QUERY_RETRY_DELAY_SECONDS}s")
+                    await asyncio.sleep(QUERY_RETRY_DELAY_SECONDS)
+                    continue
+                raise
+
+    query_response_cache = QueryResponseCache()
+
+    def make_citation(document_data: Dict) -> Dict[str, Any]:
+        """Build the citation entry for a document"""
+        filename = document_data["filename"]
+        return {
+            "filename": filename,
+            "file_path": document_data.get("file_path", f"documents/{filename}"),
+            "document_id": document_data["id"],
+            "title": os.path.splitext(filename)[0].replace('_', ' ').title()
+        }
+
+    def get_notebook_citations(notebook_documents: List[Dict]) -> List[Dict[str, Any]]:
+        """Get the prebuilt citation entries for a list of documents"""
+        # Documents stored before citations were prebuilt have theirs built here
+        return [doc.get("citation") or make_citation(doc) for doc in notebook_documents]
+
+    # Cache clears run in the background after each insert; keep references so the
+    # tasks aren't garbage-collected mid-flight and so shutdown can wait for them
+    pending_cache_clears: set = set()
+
+    async def safe_cache_clear(rag: LightRAG, label: str, timeout: float = 10.0):
+        """Clear the LightRAG LLM cache, logging instead of raising on failure"""
+        try:
+            await asyncio.wait_for(rag.aclear_cache(), timeout=timeout)
+            logger.info(f"Cache cleared for {label}")
+        except asyncio.TimeoutError:
+            logger.warning("Cache clear timed out, continuing anyway")
+        except Exception as cache_error:
+            logger.warning(f"Cache clear failed: {cache_error}, continuing anyway")
+
+    def schedule_cache_clear(rag: LightRAG, label: str):
+        """Run safe_cache_clear as a background task"""
+        task = asyncio.create_task(safe_cache_clear(rag, label))
+        pending_cache_clears.add(task)
+        task.add_done_callback(pending_cache_clears.discard)
+
+    # Deletes clear the cache once per notebook after a short idle window, so a
+    # bulk cleanup triggers one clear instead of one per document
+    CACHE_CLEAR_DEBOUNCE_SECONDS = 5.0
+    debounced_cache_clears: Dict[str, asyncio.TimerHandle] = {}
+
+    def schedule_debounced_cache_clear(rag: LightRAG, notebook_id: str):
+        """(Re)start the idle timer for a notebook's cache clear"""
+        handle = debounced_cache_clears.pop(notebook_id, None)
+        if handle is not None:
+            handle.cancel()
+        
+        def fire():
+            debounced_cache_clears.pop(notebook_id, None)
+            schedule_cache_clear(rag, f"notebook {notebook_id}")
+        
+        debounced_cache_clears[notebook_id] = asyncio.get_running_loop().call_later(CACHE_CLEAR_DEBOUNCE_SECONDS, fire)
+
+    @app.on_event("shutdown")
+    async def wait_for_pending_cache_clears():
+        if pending_cache_clears:
+            logger.info(f"Waiting for {len(pending_cache_clears)} pending cache clears")
+            await asyncio.wait(pending_cache_clears, timeout=15.0)
+
+    # Large documents are inserted as several paragraph-aligned super-chunks so
+    # LightRAG can pipeline chunking and embedding across them
+    SUPER_CHUNK_CHARS = 50000
+    SUPER_CHUNK_OVERLAP_CHARS = 400  # ~100 tokens, matching chunk_overlap_token_size
+
+    def split_into_super_chunks(text: str, max_chars: int = SUPER_CHUNK_CHARS, overlap_chars: int = SUPER_CHUNK_OVERLAP_CHARS) -> List[str]:
+        """Split text into overlapping pieces of at most max_chars, preferring paragraph boundaries"""
+        if len(text) <= max_chars:
+            return [text]
         
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = min(start + max_chars, len(text))
+            if end < len(text):
+                boundary = text.rfind("\n\n", start + max_chars // 2, end)
+                if boundary != -1:
+                    end = boundary
+            chunks.append(text[start:end])
+            if end >= len(text):
+                break
+            start = max(end - overlap_chars, start + 1)
+        return chunks
+
+    # Extracted text lives in a content file next to the metadata rather than in the
+    # document record, so neither the documents table nor the ingest queue holds it
+    def write_document_content(document_id: str, text_content: str) -> str:
+        """Write a document's extracted text to its content file and return the path"""
+        content_file = Path(data_dir) / f"content_{document_id}.txt"
+        with open(content_file, 'w', encoding='utf-8') as f:
+            f.write(text_content)
+        return str(content_file)
+
+    def read_document_content(document_data: Dict[str, Any]) -> Optional[str]:
+        """Load a document's extracted text, from the record (older uploads) or its content file"""
+        text_content = document_data.get("content")
+        if text_content or "content_file" not in document_data:
+            return text_content
+        content_file = Path(document_data["content_file"])
+        if not content_file.exists():
+            logger.warning(f"Content file not found: {content_file}")
+            return None
+        with open(content_file, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def remove_content_files(content_files: List[str]):
+        """Delete documents' content files, ignoring any that are already gone"""
+        for content_file in content_files:
+            try:
+                Path(content_file).unlink(missing_ok=True)
+                logger.info(f"Cleaned up content file during deletion: {content_file}")
+            except Exception as e:
+                logger.warning(f"Failed to clean up content file during deletion: {e}")
+
+    async def ingest_document(notebook_id: str, document_id: str):
+        """Load a queued document's text and feed it to LightRAG"""
+        document_data = lightrag_documents_db.get(document_id)
+        if document_data is None:
+            logger.info(f"Skipping document {document_id}, it was deleted before processing")
+            return
+        # Only the documents being processed have their text in memory
+        text_content = await asyncio.to_thread(read_document_content, document_data)
         await process_notebook_document(notebook_id, document_id, text_content)
 
+    # Uploads are extracted in the request handler and queued here. Each notebook's
+    # documents go in one at a time, since its LightRAG instance runs a single insert
+    # pipeline, while up to INGEST_WORKERS documents from different notebooks are
+    # processed at once. Pending entries are just ids with the text on disk, so the
+    # queue is deliberately unbounded rather than holding upload requests open.
+    INGEST_WORKERS = max(1, int(os.getenv("CLARA_INGEST_WORKERS", "4")))
+    ingest_queue = NotebookIngestQueue(ingest_document, INGEST_WORKERS)
+
+    def enqueue_document(notebook_id: str, document_id: str):
+        """Queue a document for background processing"""
+        ingest_queue.put(notebook_id, document_id)
+        logger.info(f"Queued document {document_id} for processing ({ingest_queue.pending()} pending)")
+
+    @app.on_event("shutdown")
+    async def stop_ingest_queue():
+        ingest_queue.cancel()
+
+    # Transient provider errors during insertion are retried with jittered exponential
+    # backoff; a whole-insert timeout or an auth/model error fails the document at once
+    INSERT_RETRY_ATTEMPTS = 3
+    INSERT_RETRY_MIN_DELAY = 2.0
+    INSERT_RETRY_MAX_DELAY = 60.0
+    RETRYABLE_INSERT_ERRORS = ('connection', 'timeout', 'timed out', 'rate limit', '429')
+
+    async def ainsert_with_retry(rag, texts: List[str], ids: List[str], timeout: float):
+        """Insert texts into LightRAG, retrying transient provider errors"""
+        for attempt in range(INSERT_RETRY_ATTEMPTS):
+            try:
+                return await asyncio.wait_for(rag.ainsert(texts, ids=ids), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                error_str = str(e).lower()
+                if attempt == INSERT_RETRY_ATTEMPTS - 1 or not any(keyword in error_str for keyword in RETRYABLE_INSERT_ERRORS):
+                    raise
+                delay = min(INSERT_RETRY_MAX_DELAY, INSERT_RETRY_MIN_DELAY * 2 ** attempt + random.random())
+                logger.warning(f"LightRAG insertion failed (attempt {attempt + 1}/{INSERT_RETRY_ATTEMPTS}): {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def hash_text_content(text_content: str, slice_chars: int = 65536) -> str:
+        """Short content hash for document IDs, encoding the text a slice at a time"""
+        content_hash = hashlib.blake2b(digest_size=4)
+        for i in range(0, len(text_content), slice_chars):
+            content_hash.update(text_content[i:i + slice_chars].encode())
+        return content_hash.hexdigest()
+
     async def process_notebook_document(notebook_id: str, document_id: str, text_content: str):
         """Background task to process document with LightRAG"""
         try:
@@ -1212,19 +2011,23 @@ if LIGHTRAG_AVAILABLE:
                 text_content = text_content[:max_content_size] + "\n\n[Content truncated due to size limits]"
             
             # Create a more specific document ID to avoid conflicts
-            import hashlib
-            import time
             timestamp = str(int(time.time() * 1000))  # milliseconds
-            content_hash = hashlib.md5(text_content.encode()).hexdigest()[:8]
+            content_hash = hash_text_content(text_content)
             prefixed_doc_id = f"doc_{notebook_id}_{document_id}_{timestamp}_{content_hash}"
             
-            logger.info(f"Processing document {document_id} ({len(text_content)} chars) with ID {prefixed_doc_id}")
+            super_chunks = split_into_super_chunks(text_content)
+            if len(super_chunks) == 1:
+                lightrag_ids = [prefixed_doc_id]
+            else:
+                lightrag_ids = [f"{prefixed_doc_id}_{i}" for i in range(len(super_chunks))]
+            
+            logger.info(f"Processing document {document_id} ({len(text_content)} chars, {len(super_chunks)} parts) with ID {prefixed_doc_id}")
             
             # Set document status to processing before starting
             if document_id in lightrag_documents_db:
                 lightrag_documents_db[document_id]["status"] = "processing"
                 lightrag_documents_db[document_id]["processed_at"] = datetime.now()
-                save_documents_db()
+                save_documents_db(document_id)
             
             # Get document metadata including file path for citations
             document_data = lightrag_documents_db[document_id]
@@ -1235,11 +2038,8 @@ if LIGHTRAG_AVAILABLE:
             try:
                 logger.info(f"Starting LightRAG insertion for document {document_id}")
                 
-                # Use asyncio timeout to prevent hanging
-                await asyncio.wait_for(
-                        rag.ainsert(text_content, ids=[prefixed_doc_id]),
-                        timeout=processing_timeout
-                )
+                # Each attempt runs under the timeout to prevent hanging
+                await ainsert_with_retry(rag, super_chunks, lightrag_ids, processing_timeout)
                 
                 logger.info(f"Successfully inserted document {document_id} into LightRAG")
                 
@@ -1262,19 +2062,14 @@ if LIGHTRAG_AVAILABLE:
                 else:
                     raise Exception(f"Document processing failed: {str(insert_error)}")
             
-            # Force cache clear after inserting document
-            try:
-                await asyncio.wait_for(rag.aclear_cache(), timeout=60.0)
-                logger.info(f"Cache cleared for document {document_id}")
-            except asyncio.TimeoutError:
-                logger.warning("Cache clear timed out, continuing anyway")
-            except Exception as cache_error:
-                logger.warning(f"Cache clear failed: {cache_error}, continuing anyway")
+            # Clear cache after inserting document without holding up the next one
+            schedule_cache_clear(rag, f"document {document_id}")
             
             # Update document status to completed
             if document_id in lightrag_documents_db:
                 lightrag_documents_db[document_id]["status"] = "completed"
                 lightrag_documents_db[document_id]["lightrag_id"] = prefixed_doc_id
+                lightrag_documents_db[document_id]["lightrag_ids"] = lightrag_ids
                 lightrag_documents_db[document_id]["completed_at"] = datetime.now()
                 # Clear any previous error
                 if "error" in lightrag_documents_db[document_id]:
@@ -1304,19 +2099,20 @@ if LIGHTRAG_AVAILABLE:
                 if "summary_cache" in lightrag_notebooks_db[notebook_id]:
                     del lightrag_notebooks_db[notebook_id]["summary_cache"]
                     logger.info(f"Cleared summary cache for notebook {notebook_id}")
-                if "docs_fingerprint" in lightrag_notebooks_db[notebook_id]:
-                    del lightrag_notebooks_db[notebook_id]["docs_fingerprint"]
+                bump_docs_version(notebook_id)
+            
+            # LightRAG has rewritten the graph; don't serve a stale stat of it
+            cached_graphml_stat.cache_clear()
             
             # Save changes to disk
-            save_documents_db()
-            save_notebooks_db()
+            save_documents_db(document_id)
+            save_notebooks_db(notebook_id)
             
             logger.info(f"Successfully completed processing document {document_id} in notebook {notebook_id}")
             
         except Exception as e:
             error_msg = str(e)
-            logger.error(f"Error processing document {document_id} in notebook {notebook_id}: {error_msg}")
-            logger.error(f"Full error traceback: {traceback.format_exc()}")
+            logger.exception(f"Error processing document {document_id} in notebook {notebook_id}: {error_msg}")
             
             # Update document status to failed
             if document_id in lightrag_documents_db:
@@ -1324,7 +2120,7 @@ if LIGHTRAG_AVAILABLE:
                 lightrag_documents_db[document_id]["error"] = error_msg
                 lightrag_documents_db[document_id]["failed_at"] = datetime.now()
                 # Save changes to disk even on failure
-                save_documents_db()
+                save_documents_db(document_id)
 
 class TTSRequest(BaseModel):
     text: str
@@ -1467,7 +2263,7 @@ if LIGHTRAG_AVAILABLE:
             await create_lightrag_instance(notebook_id, corrected_llm_provider, corrected_embedding_provider)
             logger.info(f"Created notebook {notebook_id}: {notebook.name}")
             # Save to disk after successful creation
-            save_notebooks_db()
+            save_notebooks_db(notebook_id)
             
             # Log the saved data
             logger.info(f"Saved notebook data: {lightrag_notebooks_db[notebook_id]}")
@@ -1550,27 +2346,35 @@ if LIGHTRAG_AVAILABLE:
         validate_notebook_exists(notebook_id)
         
         # Remove all documents from this notebook
-        notebook_docs = [doc_id for doc_id, doc in lightrag_documents_db.items() 
-                        if doc["notebook_id"] == notebook_id]
-        
-        for doc_id in notebook_docs:
-            del lightrag_documents_db[doc_id]
+        notebook_document_ids = list(notebook_documents_index.pop(notebook_id, {}))
+        content_files = []
+        for doc_id in notebook_document_ids:
+            document_data = lightrag_documents_db.pop(doc_id, None)
+            if document_data and "content_file" in document_data:
+                content_files.append(document_data["content_file"])
+        # Pending and failed documents still have their extracted text on disk
+        if content_files:
+            await asyncio.to_thread(remove_content_files, content_files)
         
         # Remove LightRAG instance
         if notebook_id in lightrag_instances:
             del lightrag_instances[notebook_id]
+        await evict_override_rags(notebook_id)
+        await query_response_cache.invalidate_notebook(notebook_id)
+        ingest_queue.discard(notebook_id)
         
         # Remove notebook
         del lightrag_notebooks_db[notebook_id]
         
         # Clean up storage directory
         storage_dir = LIGHTRAG_STORAGE_PATH / notebook_id
+        graph_cache.pop(str(storage_dir / GRAPHML_FILENAME), None)
         if storage_dir.exists():
             shutil.rmtree(storage_dir, ignore_errors=True)
         
         # Save changes to disk
-        save_notebooks_db()
-        save_documents_db()
+        save_notebooks_db(notebook_id)
+        save_documents_db(*notebook_document_ids)
         
         logger.info(f"Deleted notebook {notebook_id}")
         return {"message": "Notebook deleted successfully"}
@@ -1578,7 +2382,6 @@ if LIGHTRAG_AVAILABLE:
     @app.post("/notebooks/{notebook_id}/documents", response_model=List[NotebookDocumentResponse])
     async def upload_notebook_documents(
         notebook_id: str,
-        background_tasks: BackgroundTasks,
         files: List[UploadFile] = File(...)
     ):
         """Upload multiple documents to a notebook"""
@@ -1590,7 +2393,7 @@ if LIGHTRAG_AVAILABLE:
         uploaded_documents = []
         
         # Process files sequentially to avoid conflicts
-        for i, file in enumerate(files):
+        for file in files:
             if not file.filename:
                 continue
                 
@@ -1603,6 +2406,8 @@ if LIGHTRAG_AVAILABLE:
                 
                 # Extract text based on file type
                 text_content = await extract_text_from_file(file.filename, file_content)
+                # The raw upload isn't needed past extraction; don't hold it through the rest
+                del file_content
                 
                 # Validate text content
                 if not text_content.strip():
@@ -1612,7 +2417,13 @@ if LIGHTRAG_AVAILABLE:
                 # Create file path for citation tracking
                 file_path = f"notebooks/{notebook_id}/{file.filename}"
                 
-                # Create document record with content stored for potential retry
+                # Store the extracted text in a content file for processing and retries;
+                # the ingest worker reads it back when the document's turn comes
+                content_length = len(text_content)
+                content_file = await asyncio.to_thread(write_document_content, document_id, text_content)
+                logger.info(f"Stored content for document {document_id} ({content_length} characters) in {content_file}")
+                
+                # Create document record
                 document_data = {
                     "id": document_id,
                     "filename": file.filename,
@@ -1620,42 +2431,15 @@ if LIGHTRAG_AVAILABLE:
                     "uploaded_at": datetime.now(),
                     "status": "processing",
                     "file_path": file_path,
-                    "content": text_content  # Store content for retry functionality
+                    "content_file": content_file,
+                    "content_size": content_length  # Content size info for monitoring
                 }
                 
-                # Debug: Log that content is being stored
-                content_length = len(text_content)
-                logger.info(f"Storing document {document_id} with content length: {content_length} characters")
-                
-                # Add content size info for monitoring
-                document_data["content_size"] = content_length
-                
-                # For very large documents, consider storing content in a separate file
-                # This prevents JSON serialization issues with very large documents
-                if content_length > 1000000:  # 1MB threshold
-                    logger.info(f"Large document detected ({content_length} chars), using file storage for content")
-                    content_file = Path(data_dir) / f"content_{document_id}.txt"
-                    try:
-                        with open(content_file, 'w', encoding='utf-8') as f:
-                            f.write(text_content)
-                        document_data["content_file"] = str(content_file)
-                        # Still store content in memory for immediate use, but fallback exists
-                        logger.info(f"Content backed up to {content_file}")
-                    except Exception as e:
-                        logger.warning(f"Failed to create content backup file: {e}")
-                
-                lightrag_documents_db[document_id] = document_data
+                document_data["citation"] = make_citation(document_data)
+                add_notebook_document(document_data)
                 
-                # Add background task for document processing with a slight delay to avoid conflicts
-                # Increase delay for larger documents or more concurrent uploads
-                delay_seconds = min(i * 3, 30)  # 3 second delay between docs, max 30 seconds
-                background_tasks.add_task(
-                    process_notebook_document_with_delay, 
-                    notebook_id, 
-                    document_id, 
-                    text_content,
-                    delay_seconds
-                )
+                # Queue document for processing by the ingest workers
+                enqueue_document(notebook_id, document_id)
                 
                 # Update notebook document count
                 lightrag_notebooks_db[notebook_id]["document_count"] += 1
@@ -1670,8 +2454,8 @@ if LIGHTRAG_AVAILABLE:
                 )
         
         # Save changes to disk after all uploads
-        save_documents_db()
-        save_notebooks_db()
+        save_documents_db(*(document.id for document in uploaded_documents))
+        save_notebooks_db(notebook_id)
         
         logger.info(f"Uploaded {len(uploaded_documents)} documents to notebook {notebook_id}")
         return uploaded_documents
@@ -1683,14 +2467,17 @@ if LIGHTRAG_AVAILABLE:
         
         notebook_documents = [
             NotebookDocumentResponse(**doc) 
-            for doc in lightrag_documents_db.values() 
-            if doc["notebook_id"] == notebook_id
+            for doc in get_notebook_documents(notebook_id)
         ]
         
         return notebook_documents
 
     @app.delete("/notebooks/{notebook_id}/documents/{document_id}")
-    async def delete_notebook_document(notebook_id: str, document_id: str):
+    async def delete_notebook_document(
+        notebook_id: str,
+        document_id: str,
+        clear_cache: bool = Query(True, description="Clear the LightRAG cache (debounced per notebook)")
+    ):
         """Delete a specific document from a notebook"""
         validate_notebook_exists(notebook_id)
         
@@ -1705,25 +2492,23 @@ if LIGHTRAG_AVAILABLE:
             rag = await get_lightrag_instance(notebook_id)
             document_data = lightrag_documents_db[document_id]
             
-            # Use the stored LightRAG ID if available, otherwise construct it
-            lightrag_id = document_data.get("lightrag_id", f"doc_{notebook_id}_{document_id}")
-            await rag.adelete_by_doc_id(lightrag_id)
+            # Use the stored LightRAG IDs if available, otherwise construct one
+            lightrag_ids = document_data.get("lightrag_ids") or [
+                document_data.get("lightrag_id", f"doc_{notebook_id}_{document_id}")
+            ]
+            for lightrag_id in lightrag_ids:
+                await rag.adelete_by_doc_id(lightrag_id)
             
-            # Clear cache after deleting document
-            await rag.aclear_cache()
+            # Clear cache once deletions for this notebook go quiet
+            if clear_cache:
+                schedule_debounced_cache_clear(rag, notebook_id)
             
             # Clean up content file if it exists
             if "content_file" in document_data:
-                try:
-                    content_file = Path(document_data["content_file"])
-                    if content_file.exists():
-                        content_file.unlink()
-                        logger.info(f"Cleaned up content file during deletion: {content_file}")
-                except Exception as e:
-                    logger.warning(f"Failed to clean up content file during deletion: {e}")
+                await asyncio.to_thread(remove_content_files, [document_data["content_file"]])
             
             # Remove from database
-            del lightrag_documents_db[document_id]
+            remove_notebook_document(document_id)
             
             # Update notebook document count
             lightrag_notebooks_db[notebook_id]["document_count"] -= 1
@@ -1731,12 +2516,12 @@ if LIGHTRAG_AVAILABLE:
             # Clear summary cache since documents have changed
             if "summary_cache" in lightrag_notebooks_db[notebook_id]:
                 del lightrag_notebooks_db[notebook_id]["summary_cache"]
-            if "docs_fingerprint" in lightrag_notebooks_db[notebook_id]:
-                del lightrag_notebooks_db[notebook_id]["docs_fingerprint"]
+            bump_docs_version(notebook_id)
+            cached_graphml_stat.cache_clear()
             
             # Save changes to disk
-            save_documents_db()
-            save_notebooks_db()
+            save_documents_db(document_id)
+            save_notebooks_db(notebook_id)
             
             logger.info(f"Deleted document {document_id} from notebook {notebook_id}")
             return {"message": "Document deleted successfully"}
@@ -1745,8 +2530,27 @@ if LIGHTRAG_AVAILABLE:
             logger.error(f"Error deleting document {document_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
 
+    @app.post("/notebooks/{notebook_id}/cache/clear")
+    async def clear_notebook_cache(notebook_id: str):
+        """Clear the LightRAG cache for a notebook"""
+        validate_notebook_exists(notebook_id)
+        
+        try:
+            rag = await get_lightrag_instance(notebook_id)
+            handle = debounced_cache_clears.pop(notebook_id, None)
+            if handle is not None:
+                handle.cancel()
+            await rag.aclear_cache()
+            logger.info(f"Cache cleared for notebook {notebook_id}")
+            return {"message": "Cache cleared successfully"}
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error clearing cache for notebook {notebook_id}: {e}")
+            raise HTTPException(status_code=500, detail=f"Error clearing cache: {str(e)}")
+
     @app.post("/notebooks/{notebook_id}/documents/{document_id}/retry", response_model=DocumentRetryResponse)
-    async def retry_failed_document(notebook_id: str, document_id: str, background_tasks: BackgroundTasks):
+    async def retry_failed_document(notebook_id: str, document_id: str):
         """Retry processing a failed document"""
         validate_notebook_exists(notebook_id)
         
@@ -1771,22 +2575,13 @@ if LIGHTRAG_AVAILABLE:
             # Debug: Log document data keys
             logger.info(f"Document data keys: {list(document_data.keys())}")
             
-            # Get the original text content from the failed document
-            # Check if we have stored content or need to re-extract it
-            text_content = document_data.get("content")
-            
-            # If content is not in memory, try to load from content file (for large documents)
-            if not text_content and "content_file" in document_data:
-                try:
-                    content_file = Path(document_data["content_file"])
-                    if content_file.exists():
-                        with open(content_file, 'r', encoding='utf-8') as f:
-                            text_content = f.read()
-                        logger.info(f"Loaded content from backup file: {content_file}")
-                    else:
-                        logger.warning(f"Content file not found: {content_file}")
-                except Exception as e:
-                    logger.error(f"Failed to load content from file: {e}")
+            # Get the original text content from the failed document, stored in the
+            # record by older uploads or in its content file
+            try:
+                text_content = await asyncio.to_thread(read_document_content, document_data)
+            except Exception as e:
+                logger.error(f"Failed to load content from file: {e}")
+                text_content = None
             
             # Debug: Log content availability
             if text_content:
@@ -1815,16 +2610,11 @@ if LIGHTRAG_AVAILABLE:
             
             # Update the document in database
             lightrag_documents_db[document_id] = document_data
-            save_documents_db()
+            save_documents_db(document_id)
             
-            # Add background task to retry processing
+            # Queue document to retry processing
             # The LightRAG cache will automatically skip chunks that were already processed
-            background_tasks.add_task(
-                process_notebook_document, 
-                notebook_id, 
-                document_id, 
-                text_content
-            )
+            enqueue_document(notebook_id, document_id)
             
             logger.info(f"Retry initiated for document {document_id}")
             return DocumentRetryResponse(
@@ -1841,9 +2631,43 @@ if LIGHTRAG_AVAILABLE:
             # Reset status back to failed if retry setup failed
             document_data["status"] = "failed"
             lightrag_documents_db[document_id] = document_data
-            save_documents_db()
+            save_documents_db(document_id)
             raise HTTPException(status_code=500, detail=f"Error initiating retry: {str(e)}")
 
+    def get_adjusted_query_params(notebook: Dict[str, Any], query: NotebookQueryRequest) -> tuple:
+        """Get the (mode, top_k) to query with, reduced for smaller models"""
+        llm_provider = query.llm_provider or notebook.get("llm_provider", {})
+        model_name = llm_provider.get("model", "").lower()
+        
+        # Adjust query parameters based on model capabilities
+        adjusted_top_k = query.top_k
+        adjusted_mode = query.mode
+        
+        # For smaller models like Gemma, use more conservative query parameters
+        if SMALL_MODEL_RE.search(model_name):
+            logger.info(f"Optimizing query for smaller model: {model_name}")
+            # Reduce top_k to limit context size
+            adjusted_top_k = min(query.top_k, 30)
+            # For very complex queries, prefer local mode to reduce context
+            if query.mode == "global" and len(query.question.split()) > 20:
+                adjusted_mode = "hybrid"
+                logger.info("Switching from global to hybrid mode for complex query on small model")
+        
+        return adjusted_mode, adjusted_top_k
+
+    async def get_query_rag_instance(notebook_id: str, query: NotebookQueryRequest) -> LightRAG:
+        """Get the notebook's RAG instance, or a temporary one if the query overrides the LLM provider"""
+        if query.llm_provider:
+            # Use override provider for this query
+            logger.info(f"Using override LLM provider for query: {query.llm_provider.get('name', 'Unknown')}")
+            embedding_provider = lightrag_notebooks_db[notebook_id]["embedding_provider"]  # Keep existing embedding provider
+            
+            # Reuse (or create) a temporary RAG instance with override provider
+            return await get_override_rag_instance(notebook_id, query.llm_provider, embedding_provider)
+        
+        # Use existing RAG instance
+        return await get_lightrag_instance(notebook_id)
+
     @app.post("/notebooks/{notebook_id}/query", response_model=NotebookQueryResponse)
     async def query_notebook(notebook_id: str, query: NotebookQueryRequest):
         """Query a notebook with a question"""
@@ -1852,41 +2676,25 @@ if LIGHTRAG_AVAILABLE:
         try:
             logger.info(f"Query request for notebook {notebook_id}")
             
-            # Get the current RAG instance or create a new one if provider is overridden
-            if query.llm_provider:
-                # Use override provider for this query
-                logger.info(f"Using override LLM provider for query: {query.llm_provider.get('name', 'Unknown')}")
-                notebook = lightrag_notebooks_db[notebook_id]
-                embedding_provider = notebook["embedding_provider"]  # Keep existing embedding provider
-                
-                # Create temporary RAG instance with override provider
-                rag = await create_lightrag_instance(
-                    f"{notebook_id}_temp",
-                    query.llm_provider,
-                    embedding_provider
-                )
-            else:
-                # Use existing RAG instance
-                rag = await get_lightrag_instance(notebook_id)
-            
             # Get notebook and model information for query optimization
             notebook = lightrag_notebooks_db[notebook_id]
-            llm_provider = query.llm_provider or notebook.get("llm_provider", {})
-            model_name = llm_provider.get("model", "").lower()
-            
-            # Adjust query parameters based on model capabilities
-            adjusted_top_k = query.top_k
-            adjusted_mode = query.mode
-            
-            # For smaller models like Gemma, use more conservative query parameters
-            if 'gemma' in model_name or ('llama' in model_name and any(size in model_name for size in ['3b', '4b', '7b'])):
-                logger.info(f"Optimizing query for smaller model: {model_name}")
-                # Reduce top_k to limit context size
-                adjusted_top_k = min(query.top_k, 30)
-                # For very complex queries, prefer local mode to reduce context
-                if query.mode == "global" and len(query.question.split()) > 20:
-                    adjusted_mode = "hybrid"
-                    logger.info("Switching from global to hybrid mode for complex query on small model")
+            adjusted_mode, adjusted_top_k = get_adjusted_query_params(notebook, query)
+            
+            # Serve repeat questions from the response cache (only for the notebook's own provider)
+            notebook_documents = get_notebook_documents(notebook_id, status="completed")
+            docs_version = notebook.get("docs_version", 0)
+            cache_key = None
+            if not query.llm_provider:
+                cache_key = QueryResponseCache.make_key(
+                    notebook_id, query.question, adjusted_mode, adjusted_top_k, query.response_type, docs_version
+                )
+                cached_response = await query_response_cache.get(cache_key)
+                if cached_response is not None:
+                    logger.info(f"Returning cached query response for notebook {notebook_id}")
+                    return NotebookQueryResponse(**cached_response)
+            
+            # Get the current RAG instance or create a new one if provider is overridden
+            rag = await get_query_rag_instance(notebook_id, query)
             
             # Create query parameters
             query_param = QueryParam(
@@ -1897,45 +2705,36 @@ if LIGHTRAG_AVAILABLE:
             
             # Perform query with fallback handling for context size issues
             try:
-                result = await rag.aquery(query.question, param=query_param)
+                result = await run_rag_query(rag, query.question, query_param)
             except Exception as query_error:
-                error_str = str(query_error).lower()
+                # Re-raise non-context-size errors
+                if not CONTEXT_ERR_RE.search(str(query_error).lower()):
+                    raise
+                logger.warning(f"Context size error detected, attempting recovery: {query_error}")
                 
-                # Check if it's a context size error
-                if any(keyword in error_str for keyword in ['context size', 'context length', 'token limit', 'exceeds', 'too long']):
-                    logger.warning(f"Context size error detected, attempting recovery: {query_error}")
-                    
-                    # Try with more aggressive reduction
-                    if adjusted_mode == "global":
-                        logger.info("Retrying with local mode instead of global")
-                        fallback_param = QueryParam(
-                            mode="local",
-                            response_type=query.response_type,
-                            top_k=min(20, adjusted_top_k),
-                        )
-                        result = await rag.aquery(query.question, param=fallback_param)
-                        adjusted_mode = "local"
-                    elif adjusted_mode == "hybrid":
-                        logger.info("Retrying with naive mode instead of hybrid")
-                        fallback_param = QueryParam(
-                            mode="naive",
-                            response_type=query.response_type,
-                            top_k=min(15, adjusted_top_k),
-                        )
-                        result = await rag.aquery(query.question, param=fallback_param)
-                        adjusted_mode = "naive"
-                    else:
-                        # Already using simplest mode, try with minimal context
-                        logger.info("Retrying with minimal context")
-                        fallback_param = QueryParam(
-                            mode="naive",
-                            response_type="Single Paragraph",
-                            top_k=5,
-                        )
-                        result = await rag.aquery(query.question, param=fallback_param)
-                        adjusted_mode = "naive"
+                # Step down through progressively smaller contexts until one fits
+                fallbacks = [
+                    ("local", query.response_type, min(20, adjusted_top_k)),
+                    ("naive", query.response_type, min(15, adjusted_top_k)),
+                    ("naive", "Single Paragraph", 5),
+                ]
+                for fallback_mode, fallback_response_type, fallback_top_k in fallbacks:
+                    logger.info(f"Retrying with mode={fallback_mode}, top_k={fallback_top_k}")
+                    fallback_param = QueryParam(
+                        mode=fallback_mode,
+                        response_type=fallback_response_type,
+                        top_k=fallback_top_k,
+                    )
+                    try:
+                        result = await run_rag_query(rag, query.question, fallback_param)
+                    except Exception as fallback_error:
+                        if not CONTEXT_ERR_RE.search(str(fallback_error).lower()):
+                            raise
+                        query_error = fallback_error
+                        continue
+                    adjusted_mode = fallback_mode
+                    break
                 else:
-                    # Re-raise non-context-size errors
                     raise query_error
             
             # Extract citation information from the result if available
@@ -1944,20 +2743,8 @@ if LIGHTRAG_AVAILABLE:
                 # Check if the result contains citation information
                 # LightRAG may return metadata about sources used
                 # For now, we'll extract from document metadata
-                notebook_documents = [
-                    doc for doc in lightrag_documents_db.values() 
-                    if doc["notebook_id"] == notebook_id and doc["status"] == "completed"
-                ]
-                
                 # Create citations list with available document information
-                for doc in notebook_documents:
-                    citation = {
-                        "filename": doc["filename"],
-                        "file_path": doc.get("file_path", f"documents/{doc['filename']}"),
-                        "document_id": doc["id"],
-                        "title": doc["filename"].replace('_', ' ').replace('.txt', '').replace('.pdf', '').replace('.md', '').title()
-                    }
-                    citations.append(citation)
+                citations = get_notebook_citations(notebook_documents)
                 
                 # Limit citations to prevent overwhelming the response
                 citations = citations[:10] if citations else None
@@ -1966,7 +2753,7 @@ if LIGHTRAG_AVAILABLE:
                 logger.warning(f"Error extracting citations: {citation_error}")
                 citations = None
             
-            return NotebookQueryResponse(
+            response = NotebookQueryResponse(
                 answer=result,
                 mode=adjusted_mode,
                 context_used=True,
@@ -1975,10 +2762,88 @@ if LIGHTRAG_AVAILABLE:
                 chat_context_used=False  # Will be enhanced when chat history is implemented
             )
             
+            if cache_key is not None:
+                await query_response_cache.put(cache_key, response.model_dump())
+            
+            return response
+            
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error processing query for notebook {notebook_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+    def sse_event(payload: Dict[str, Any]) -> str:
+        """Format a payload as a server-sent event frame"""
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.post("/notebooks/{notebook_id}/query/stream")
+    async def stream_query_notebook(notebook_id: str, query: NotebookQueryRequest):
+        """Query a notebook, streaming the answer as server-sent events"""
+        validate_notebook_exists(notebook_id)
+        
+        try:
+            logger.info(f"Streaming query request for notebook {notebook_id}")
+            
+            notebook = lightrag_notebooks_db[notebook_id]
+            adjusted_mode, adjusted_top_k = get_adjusted_query_params(notebook, query)
+            notebook_documents = get_notebook_documents(notebook_id, status="completed")
+            rag = await get_query_rag_instance(notebook_id, query)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error preparing streaming query for notebook {notebook_id}: {e}")
+            raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+        
+        query_param = QueryParam(
+            mode=adjusted_mode,
+            response_type=query.response_type,
+            top_k=adjusted_top_k,
+            stream=True,
+        )
+        
+        async def event_stream():
+            try:
+                response = await asyncio.wait_for(rag.aquery(query.question, param=query_param), timeout=QUERY_TIMEOUT_SECONDS)
+                
+                # LightRAG returns a plain string for cached answers, otherwise an async iterator of tokens
+                if isinstance(response, str):
+                    yield sse_event({"token": response})
+                else:
+                    tokens = response.__aiter__()
+                    while True:
+                        # Bound the wait for each token so a stalled upstream still ends the stream
+                        try:
+                            token = await asyncio.wait_for(tokens.__anext__(), timeout=QUERY_TIMEOUT_SECONDS)
+                        except StopAsyncIteration:
+                            break
+                        yield sse_event({"token": token})
+                
+                citations = get_notebook_citations(notebook_documents)[:10]
+                yield sse_event({"done": True, "mode": adjusted_mode, "citations": citations or None})
+            except asyncio.TimeoutError:
+                logger.error(f"Streaming query for notebook {notebook_id} stalled for {QUERY_TIMEOUT_SECONDS:.0f}s")
+                yield sse_event({"error": f"Query timed out after {QUERY_TIMEOUT_SECONDS:.0f} seconds"})
+            except Exception as e:
+                logger.error(f"Error streaming query for notebook {notebook_id}: {e}")
+                yield sse_event({"error": f"Error processing query: {str(e)}"})
+        
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    SUMMARY_QUESTION = (
+        "Write down a comprehensive summary of all the documents provided in a single paragraph. "
+        "Mention what the documents are about, the main topics they cover, key themes, "
+        "important findings or insights, and the overall scope of the content. "
+        "Focus on providing an overview that helps understand the nature and breadth of the knowledge base."
+    )
+
+    # Query parameters optimized for summary generation
+    SUMMARY_QUERY_PARAM = QueryParam(
+        mode="hybrid",  # Use hybrid mode for comprehensive coverage
+        response_type="Single Paragraph",  # Request single paragraph format
+        top_k=100,  # Use higher top_k to get broader coverage of documents
+    )
+
     @app.post("/notebooks/{notebook_id}/summary", response_model=NotebookQueryResponse)
     async def generate_notebook_summary(notebook_id: str):
         """Generate an automatic summary of all documents in the notebook"""
@@ -1988,10 +2853,7 @@ if LIGHTRAG_AVAILABLE:
             logger.info(f"Summary generation request for notebook {notebook_id}")
             
             # Check if there are any completed documents
-            notebook_documents = [
-                doc for doc in lightrag_documents_db.values() 
-                if doc["notebook_id"] == notebook_id and doc["status"] == "completed"
-            ]
+            notebook_documents = get_notebook_documents(notebook_id, status="completed")
             
             if not notebook_documents:
                 return NotebookQueryResponse(
@@ -2003,33 +2865,18 @@ if LIGHTRAG_AVAILABLE:
                     chat_context_used=False
                 )
             
-            # Create a fingerprint of current documents (using document IDs and upload times)
-            current_docs_fingerprint = "|".join(sorted([
-                f"{doc['id']}:{doc['uploaded_at'].isoformat() if isinstance(doc['uploaded_at'], datetime) else doc['uploaded_at']}" 
-                for doc in notebook_documents
-            ]))
-            
             # Check if we have a cached summary that's still valid
             notebook_data = lightrag_notebooks_db[notebook_id]
+            docs_version = notebook_data.get("docs_version", 0)
             cached_summary = notebook_data.get("summary_cache")
-            cached_fingerprint = notebook_data.get("docs_fingerprint")
             
-            # If we have a valid cached summary, return it
-            if (cached_summary and cached_fingerprint and 
-                cached_fingerprint == current_docs_fingerprint):
+            # If we have a summary cached at the current documents version, return it
+            if cached_summary and notebook_data.get("summary_version") == docs_version:
                 logger.info(f"Returning cached summary for notebook {notebook_id}")
                 
                 # Extract citation information for all completed documents
-                citations = []
                 try:
-                    for doc in notebook_documents:
-                        citation = {
-                            "filename": doc["filename"],
-                            "file_path": doc.get("file_path", f"documents/{doc['filename']}"),
-                            "document_id": doc["id"],
-                            "title": doc["filename"].replace('_', ' ').replace('.txt', '').replace('.pdf', '').replace('.md', '').title()
-                        }
-                        citations.append(citation)
+                    citations = get_notebook_citations(notebook_documents)
                 except Exception as citation_error:
                     logger.warning(f"Error extracting citations for cached summary: {citation_error}")
                     citations = None
@@ -2049,34 +2896,15 @@ if LIGHTRAG_AVAILABLE:
             # Get existing RAG instance
             rag = await get_lightrag_instance(notebook_id)
             
-            # Create summary query
-            summary_question = ("Write down a comprehensive summary of all the documents provided in a single paragraph. "
-                              "Mention what the documents are about, the main topics they cover, key themes, "
-                              "important findings or insights, and the overall scope of the content. "
-                              "Focus on providing an overview that helps understand the nature and breadth of the knowledge base.")
-            
-            # Create query parameters optimized for summary generation
-            query_param = QueryParam(
-                mode="hybrid",  # Use hybrid mode for comprehensive coverage
-                response_type="Single Paragraph",  # Request single paragraph format
-                top_k=100,  # Use higher top_k to get broader coverage of documents
-            )
+            # Build citations off the event loop while the LLM generates the summary
+            citations_task = asyncio.create_task(asyncio.to_thread(get_notebook_citations, notebook_documents))
             
-            # Perform summary query
-            result = await rag.aquery(summary_question, param=query_param)
+            # Perform summary query (on a copy of the shared params, since QueryParam is mutable)
+            result = await run_rag_query(rag, SUMMARY_QUESTION, copy.copy(SUMMARY_QUERY_PARAM))
             
             # Extract citation information for all completed documents
-            citations = []
             try:
-                for doc in notebook_documents:
-                    citation = {
-                        "filename": doc["filename"],
-                        "file_path": doc.get("file_path", f"documents/{doc['filename']}"),
-                        "document_id": doc["id"],
-                        "title": doc["filename"].replace('_', ' ').replace('.txt', '').replace('.pdf', '').replace('.md', '').title()
-                    }
-                    citations.append(citation)
-                
+                citations = await citations_task
             except Exception as citation_error:
                 logger.warning(f"Error extracting citations for summary: {citation_error}")
                 citations = None
@@ -2089,12 +2917,12 @@ if LIGHTRAG_AVAILABLE:
                 "generated_at": datetime.now().isoformat()
             }
             
-            # Update notebook with cached summary and fingerprint
+            # Update notebook with cached summary and the documents version it reflects
             lightrag_notebooks_db[notebook_id]["summary_cache"] = summary_cache
-            lightrag_notebooks_db[notebook_id]["docs_fingerprint"] = current_docs_fingerprint
+            lightrag_notebooks_db[notebook_id]["summary_version"] = docs_version
             
             # Save to disk
-            save_notebooks_db()
+            save_notebooks_db(notebook_id)
             
             logger.info(f"Generated and cached new summary for notebook {notebook_id} with {len(notebook_documents)} documents")
             
@@ -2107,10 +2935,254 @@ if LIGHTRAG_AVAILABLE:
                 chat_context_used=False
             )
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error generating summary for notebook {notebook_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
 
+    GRAPHML_NS = '{http://graphml.graphdrawing.org/xmlns}'
+    GRAPHML_FILENAME = "graph_chunk_entity_relation.graphml"
+
+    # Parsed GraphML per file (API nodes/edges and the NetworkX graph), reused
+    # across graph requests until LightRAG rewrites the file
+    graph_cache: Dict[str, Dict[str, Any]] = {}
+
+    # Graph endpoints are polled by the frontend; stat each GraphML file at most once per bucket
+    GRAPHML_STAT_TTL_SECONDS = 1
+
+    @lru_cache(maxsize=1024)
+    def cached_graphml_stat(path_str: str, bucket: int) -> Optional[os.stat_result]:
+        """Stat a GraphML file, returning None if it doesn't exist"""
+        try:
+            return os.stat(path_str)
+        except FileNotFoundError:
+            return None
+
+    def get_graphml_stat(graphml_file: Path) -> Optional[os.stat_result]:
+        """Stat a GraphML file, reusing the result for up to GRAPHML_STAT_TTL_SECONDS"""
+        bucket = int(time.monotonic() // GRAPHML_STAT_TTL_SECONDS)
+        return cached_graphml_stat(str(graphml_file), bucket)
+
+    def get_graph_cache_entry(graphml_file: Path, mtime: float) -> Dict[str, Any]:
+        """Get the cache entry for a GraphML file, resetting it if the file has changed"""
+        key = str(graphml_file)
+        entry = graph_cache.get(key)
+        if entry is None or entry["mtime"] != mtime:
+            entry = {"mtime": mtime}
+            graph_cache[key] = entry
+        return entry
+
+    def graphml_node_to_dict(node, data_tag: str) -> Dict[str, Any]:
+        """Convert a GraphML node element to graph API node data"""
+        node_id = node.get('id')
+        node_data = {'id': node_id, 'type': 'entity', 'properties': {}}
+        
+        # Extract node attributes/data
+        for data in node.iter(data_tag):
+            key = data.get('key')
+            value = data.text or ''
+            
+            # Map common GraphML keys to readable labels
+            if key == 'd0':  # Usually entity name
+                node_data['label'] = value
+                node_data['properties']['name'] = value
+            elif key == 'd1':  # Usually entity type
+                node_data['type'] = value
+                node_data['properties']['entity_type'] = value
+            elif key == 'd2':  # Usually description
+                node_data['properties']['description'] = value
+            else:
+                node_data['properties'][key] = value
+        
+        # Use node_id as label if no label found
+        if 'label' not in node_data:
+            node_data['label'] = node_id
+        
+        return node_data
+
+    def graphml_edge_to_dict(edge, data_tag: str) -> Dict[str, Any]:
+        """Convert a GraphML edge element to graph API edge data"""
+        edge_data = {
+            'source': edge.get('source'),
+            'target': edge.get('target'),
+            'relationship': 'related_to',
+            'properties': {}
+        }
+        
+        # Extract edge attributes/data
+        for data in edge.iter(data_tag):
+            key = data.get('key')
+            value = data.text or ''
+            
+            # Map common GraphML keys for edges
+            if key == 'd3':  # Usually relationship type
+                edge_data['relationship'] = value
+                edge_data['properties']['relation_type'] = value
+            elif key == 'd4':  # Usually weight or strength
+                try:
+                    edge_data['properties']['weight'] = float(value)
+                except ValueError:
+                    edge_data['properties']['weight_str'] = value
+            elif key == 'd5':  # Usually description
+                edge_data['properties']['description'] = value
+            else:
+                edge_data['properties'][key] = value
+        
+        return edge_data
+
+    # Rendered pyvis HTML is kept next to the GraphML file, tagged with the GraphML
+    # mtime it was built from, so it survives restarts
+    GRAPH_HTML_CACHE_FILENAME = "graph_visualization.cached.html"
+    # Bounded pool for graph rendering so concurrent large graphs queue instead of
+    # oversubscribing cores or blocking the event loop
+    GRAPH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="graph-html")
+
+    # Static styling (with dark mode support) and legend spliced into every rendered graph page
+    GRAPH_STYLE_BLOCK = '''
+        <style>
+            body { 
+                margin: 0; 
+                padding: 0; 
+                font-family: Arial, sans-serif;
+                background: #f8f9fa;
+            }
+            
+            @media (prefers-color-scheme: dark) {
+                body { background: #1a1a1a; }
+            }
+            
+            .graph-container {
+                position: relative;
+                width: 100%;
+                height: 100vh;
+            }
+            
+            .graph-info {
+                position: absolute;
+                top: 10px;
+                left: 10px;
+                background: rgba(255, 255, 255, 0.9);
+                padding: 10px;
+                border-radius: 5px;
+                font-size: 12px;
+                z-index: 1000;
+                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+            }
+            
+            @media (prefers-color-scheme: dark) {
+                .graph-info { 
+                    background: rgba(30, 30, 30, 0.9); 
+                    color: white;
+                }
+            }
+            
+            .legend {
+                position: absolute;
+                top: 10px;
+                right: 10px;
+                background: rgba(255, 255, 255, 0.9);
+                padding: 10px;
+                border-radius: 5px;
+                font-size: 11px;
+                z-index: 1000;
+                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+                max-width: 200px;
+            }
+            
+            @media (prefers-color-scheme: dark) {
+                .legend { 
+                    background: rgba(30, 30, 30, 0.9); 
+                    color: white;
+                }
+            }
+            
+            .legend-item {
+                display: flex;
+                align-items: center;
+                margin: 2px 0;
+            }
+            
+            .legend-color {
+                width: 12px;
+                height: 12px;
+                border-radius: 50%;
+                margin-right: 5px;
+            }
+        </style>'''
+
+    GRAPH_LEGEND_HTML = '''
+    <div class="legend">
+        <strong>Node Types:</strong>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #FF6B6B;"></div>
+            <span>Person</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #4ECDC4;"></div>
+            <span>Organization</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #45B7D1;"></div>
+            <span>Location</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #96CEB4;"></div>
+            <span>Concept</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #FFEAA7;"></div>
+            <span>Event</span>
+        </div>
+        <div class="legend-item">
+            <div class="legend-color" style="background: #DDA0DD;"></div>
+            <span>Entity</span>
+        </div>
+    </div>
+    '''
+
+    GRAPH_ERROR_HTML_TEMPLATE = string.Template("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Knowledge Graph - Error</title>
+        <style>
+            body { font-family: Arial, sans-serif; text-align: center; padding: 50px; }
+            .error { color: #d32f2f; font-size: 18px; }
+            .details { color: #666; font-size: 14px; margin-top: 10px; }
+        </style>
+    </head>
+    <body>
+        <h2>Knowledge Graph</h2>
+        <p class="error">Error generating graph visualization</p>
+        <p class="details">$error</p>
+    </body>
+    </html>
+    """)
+
+    def read_cached_graph_html(working_dir: Path, graphml_mtime: float) -> Optional[str]:
+        """Read rendered graph HTML from disk if it was built from this GraphML version"""
+        html_file = working_dir / GRAPH_HTML_CACHE_FILENAME
+        mtime_file = html_file.with_suffix(".mtime")
+        try:
+            if float(mtime_file.read_text()) != graphml_mtime:
+                return None
+            return html_file.read_text(encoding='utf-8')
+        except (OSError, ValueError):
+            return None
+
+    def write_cached_graph_html(working_dir: Path, graphml_mtime: float, html: str):
+        """Atomically write rendered graph HTML and its GraphML mtime to disk"""
+        html_file = working_dir / GRAPH_HTML_CACHE_FILENAME
+        mtime_file = html_file.with_suffix(".mtime")
+        try:
+            for path, content in ((html_file, html), (mtime_file, repr(graphml_mtime))):
+                tmp_path = path.with_name(path.name + ".tmp")
+                tmp_path.write_text(content, encoding='utf-8')
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to cache graph HTML in {working_dir}: {e}")
+
     @app.get("/notebooks/{notebook_id}/graph")
     async def get_notebook_graph_data(notebook_id: str):
         """Get graph visualization data for a notebook"""
@@ -2119,86 +3191,48 @@ if LIGHTRAG_AVAILABLE:
         try:
             # Path to the GraphML file created by LightRAG
             working_dir = LIGHTRAG_STORAGE_PATH / notebook_id
-            graphml_file = working_dir / "graph_chunk_entity_relation.graphml"
+            graphml_file = working_dir / GRAPHML_FILENAME
             
-            if not graphml_file.exists():
+            graphml_stat = get_graphml_stat(graphml_file)
+            if graphml_stat is None:
                 return {
                     "nodes": [],
                     "edges": [],
                     "message": "No graph data available yet. Upload documents and query the notebook to generate the knowledge graph."
                 }
             
-            # Parse the GraphML file
-            tree = ET.parse(graphml_file)
-            root = tree.getroot()
-            
             # GraphML namespace
-            ns = {'graphml': 'http://graphml.graphdrawing.org/xmlns'}
-            
-            nodes = []
-            edges = []
-            
-            # Extract nodes
-            for node in root.findall('.//graphml:node', ns):
-                node_id = node.get('id')
-                node_data = {'id': node_id, 'type': 'entity', 'properties': {}}
-                
-                # Extract node attributes/data
-                for data in node.findall('graphml:data', ns):
-                    key = data.get('key')
-                    value = data.text or ''
-                    
-                    # Map common GraphML keys to readable labels
-                    if key == 'd0':  # Usually entity name
-                        node_data['label'] = value
-                        node_data['properties']['name'] = value
-                    elif key == 'd1':  # Usually entity type
-                        node_data['type'] = value
-                        node_data['properties']['entity_type'] = value
-                    elif key == 'd2':  # Usually description
-                        node_data['properties']['description'] = value
-                    else:
-                        node_data['properties'][key] = value
-                
-                # Use node_id as label if no label found
-                if 'label' not in node_data:
-                    node_data['label'] = node_id
-                
-                nodes.append(node_data)
-            
-            # Extract edges
-            for edge in root.findall('.//graphml:edge', ns):
-                source = edge.get('source')
-                target = edge.get('target')
-                edge_data = {
-                    'source': source,
-                    'target': target,
-                    'relationship': 'related_to',
-                    'properties': {}
-                }
+            graph_tag = GRAPHML_NS + 'graph'
+            node_tag = GRAPHML_NS + 'node'
+            edge_tag = GRAPHML_NS + 'edge'
+            data_tag = GRAPHML_NS + 'data'
+            
+            cache_entry = get_graph_cache_entry(graphml_file, graphml_stat.st_mtime)
+            if "data" in cache_entry:
+                nodes, edges = cache_entry["data"]
+            else:
+                nodes = []
+                edges = []
                 
-                # Extract edge attributes/data
-                for data in edge.findall('graphml:data', ns):
-                    key = data.get('key')
-                    value = data.text or ''
-                    
-                    # Map common GraphML keys for edges
-                    if key == 'd3':  # Usually relationship type
-                        edge_data['relationship'] = value
-                        edge_data['properties']['relation_type'] = value
-                    elif key == 'd4':  # Usually weight or strength
-                        try:
-                            edge_data['properties']['weight'] = float(value)
-                        except ValueError:
-                            edge_data['properties']['weight_str'] = value
-                    elif key == 'd5':  # Usually description
-                        edge_data['properties']['description'] = value
+                # Stream the GraphML file in a single pass, dropping each node/edge
+                # element once it has been converted
+                graph_elem = None
+                for event, elem in ET.iterparse(str(graphml_file), events=("start", "end")):
+                    if event == "start":
+                        if elem.tag == graph_tag:
+                            graph_elem = elem
+                        continue
+                    if elem.tag == node_tag:
+                        nodes.append(graphml_node_to_dict(elem, data_tag))
+                    elif elem.tag == edge_tag:
+                        edges.append(graphml_edge_to_dict(elem, data_tag))
                     else:
-                        edge_data['properties'][key] = value
+                        continue
+                    if graph_elem is not None:
+                        graph_elem.clear()
                 
-                edges.append(edge_data)
-            
-            logger.info(f"Loaded graph data for notebook {notebook_id}: {len(nodes)} nodes, {len(edges)} edges")
+                cache_entry["data"] = (nodes, edges)
+                logger.info(f"Loaded graph data for notebook {notebook_id}: {len(nodes)} nodes, {len(edges)} edges")
             
             return {
                 "nodes": nodes,
@@ -2221,17 +3255,277 @@ if LIGHTRAG_AVAILABLE:
             logger.error(f"Error getting graph data for notebook {notebook_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error getting graph data: {str(e)}")
 
+    # Graphs with more nodes than this are shown as one node per community, since
+    # vis.js becomes unusable well before it has drawn the full graph
+    GRAPH_COLLAPSE_NODE_THRESHOLD = 1500
+    GRAPH_COMMUNITY_LABEL_MEMBERS = 3
+    GRAPH_COMMUNITY_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD']
+
+    # Double-clicking a community node reloads the page with that community expanded
+    GRAPH_COMMUNITY_EXPAND_SCRIPT = '''
+    <script>
+        network.on("doubleClick", function (params) {
+            if (params.nodes.length) {
+                window.location.search = "?expand=" + params.nodes[0];
+            }
+        });
+    </script>
+    '''
+
+    def get_graph_communities(cache_entry: Dict[str, Any]) -> List[List[str]]:
+        """Get the Louvain communities of a cached graph, largest first (computed once per GraphML version)"""
+        if "communities" not in cache_entry:
+            communities = nx.community.louvain_communities(cache_entry["nx_graph"], weight="weight", seed=42)
+            cache_entry["communities"] = sorted((sorted(community) for community in communities), key=len, reverse=True)
+        return cache_entry["communities"]
+
+    def add_community_network(net: "Network", G: "nx.Graph", communities: List[List[str]]):
+        """Fill a pyvis network with one node per community and one edge per connected community pair"""
+        membership = {}
+        for community_id, members in enumerate(communities):
+            for node_id in members:
+                membership[node_id] = community_id
+        
+        # Label each community with its best-connected entities
+        degrees = dict(G.degree())
+        for community_id, members in enumerate(communities):
+            representatives = sorted(members, key=lambda node_id: degrees.get(node_id, 0), reverse=True)[:GRAPH_COMMUNITY_LABEL_MEMBERS]
+            net.add_node(
+                community_id,
+                label=", ".join(str(node_id)[:20] for node_id in representatives),
+                title=f"Community {community_id}\\n{len(members)} entities\\nDouble-click to expand",
+                size=min(10 + len(members) ** 0.5 * 2, 60),
+                color=GRAPH_COMMUNITY_COLORS[community_id % len(GRAPH_COMMUNITY_COLORS)]
+            )
+        
+        # Sum the weights of all edges running between each pair of communities
+        edge_weights: Dict[tuple, float] = {}
+        for source, target, data in G.edges(data=True):
+            source_community = membership[source]
+            target_community = membership[target]
+            if source_community == target_community:
+                continue
+            key = (min(source_community, target_community), max(source_community, target_community))
+            try:
+                weight = float(data.get('weight', 1.0))
+            except (ValueError, TypeError):
+                weight = 1.0
+            edge_weights[key] = edge_weights.get(key, 0.0) + weight
+        
+        for (source_community, target_community), weight in edge_weights.items():
+            net.add_edge(
+                source_community,
+                target_community,
+                value=weight,
+                title=f"Combined weight: {weight:.2f}",
+                color={"color": "#848484", "highlight": "#333333"}
+            )
+
+    def style_entity_network(net: "Network", G: "nx.Graph"):
+        """Color, size and title the entity nodes and relation edges of a pyvis network"""
+        # Define colors for different node types
+        node_type_colors = {
+            'person': '#FF6B6B',      # Red
+            'organization': '#4ECDC4', # Teal
+            'location': '#45B7D1',    # Blue
+            'concept': '#96CEB4',     # Green
+            'event': '#FFEAA7',      # Yellow
+            'entity': '#DDA0DD',     # Plum
+            'default': '#95A5A6'     # Gray
+        }
+        
+        # Enhance nodes with colors, titles, and better styling
+        for node in net.nodes:
+            # Determine node type from the data
+            node_type = 'entity'  # default
+            if 'entity_type' in node:
+                node_type = str(node['entity_type']).lower()
+            elif 'type' in node:
+                node_type = str(node['type']).lower()
+            
+            # Set color based on type
+            node["color"] = node_type_colors.get(node_type, node_type_colors['default'])
+            
+            # Add hover title with description
+            title_parts = [f"ID: {node.get('id', 'Unknown')}"]
+            if 'label' in node and node['label']:
+                title_parts.append(f"Label: {node['label']}")
+            if node_type:
+                title_parts.append(f"Type: {node_type.title()}")
+            if 'description' in node and node['description']:
+                desc = str(node['description'])[:200] + "..." if len(str(node['description'])) > 200 else str(node['description'])
+                title_parts.append(f"Description: {desc}")
+            
+            node["title"] = "\\n".join(title_parts)
+            
+            # Set node size based on connections (degree)
+            if hasattr(G, 'degree'):
+                degree = G.degree(node['id']) if node['id'] in G else 1
+                node["size"] = min(10 + degree * 2, 30)  # Size between 10-30
+            
+            # Clean up label for display
+            if 'label' in node and node['label']:
+                # Truncate long labels
+                label = str(node['label'])
+                node["label"] = label[:20] + "..." if len(label) > 20 else label
+            else:
+                # Use ID as label if no label exists
+                node_id = str(node.get('id', ''))
+                node["label"] = node_id[:20] + "..." if len(node_id) > 20 else node_id
+        
+        # Enhance edges with titles and styling
+        for edge in net.edges:
+            title_parts = []
+            
+            # Add relationship type
+            if 'relationship' in edge and edge['relationship']:
+                title_parts.append(f"Relationship: {edge['relationship']}")
+            elif 'relation_type' in edge and edge['relation_type']:
+                title_parts.append(f"Relationship: {edge['relation_type']}")
+            
+            # Add weight if available
+            if 'weight' in edge and edge['weight']:
+                try:
+                    weight = float(edge['weight'])
+                    title_parts.append(f"Weight: {weight:.2f}")
+                    # Set edge width based on weight
+                    edge["width"] = min(max(1, weight * 2), 5)
+                except (ValueError, TypeError):
+                    pass
+            
+            # Add description if available
+            if 'description' in edge and edge['description']:
+                desc = str(edge['description'])[:100] + "..." if len(str(edge['description'])) > 100 else str(edge['description'])
+                title_parts.append(f"Description: {desc}")
+            
+            if title_parts:
+                edge["title"] = "\\n".join(title_parts)
+            
+            # Style edges
+            edge["color"] = {"color": "#848484", "highlight": "#333333"}
+
+    def build_graph_html(notebook_id: str, graphml_file: Path, cache_entry: Dict[str, Any], expand: Optional[int] = None) -> str:
+        """Render the interactive pyvis page for a GraphML file (CPU-bound, runs in GRAPH_EXECUTOR)"""
+        # Load the GraphML file (reusing the parsed graph if the file is unchanged)
+        if "nx_graph" not in cache_entry:
+            logger.info(f"Loading GraphML file: {graphml_file}")
+            cache_entry["nx_graph"] = nx.read_graphml(str(graphml_file))
+        G = cache_entry["nx_graph"]
+        
+        # Large graphs are collapsed into communities; expand renders one community in full
+        communities = None
+        collapsed = False
+        if expand is not None:
+            communities = get_graph_communities(cache_entry)
+            if not 0 <= expand < len(communities):
+                raise ValueError(f"Community {expand} does not exist")
+            G = G.subgraph(communities[expand])
+        elif G.number_of_nodes() > GRAPH_COLLAPSE_NODE_THRESHOLD:
+            communities = get_graph_communities(cache_entry)
+            collapsed = True
+        
+        # Create a Pyvis network with responsive design
+        net = Network(
+            height="100vh",
+            width="100%",
+            bgcolor="#ffffff",
+            font_color="#333333",
+            notebook=False
+        )
+        
+        # Configure physics for better layout
+        net.set_options("""
+        var options = {
+          "physics": {
+            "enabled": true,
+            "stabilization": {"iterations": 100},
+            "barnesHut": {
+              "gravitationalConstant": -8000,
+              "centralGravity": 0.3,
+              "springLength": 95,
+              "springConstant": 0.04,
+              "damping": 0.09
+            }
+          },
+          "nodes": {
+            "font": {"size": 12},
+            "scaling": {
+              "min": 10,
+              "max": 30
+            }
+          },
+          "edges": {
+            "smooth": {"type": "discrete"},
+            "font": {"size": 10},
+            "scaling": {
+              "min": 1,
+              "max": 3
+            }
+          }
+        }
+        """)
+        
+        if collapsed:
+            add_community_network(net, G, communities)
+        else:
+            # Convert NetworkX graph to Pyvis network
+            net.from_nx(G)
+            style_entity_network(net, G)
+        
+        # Generate HTML in memory (no temp file round trip)
+        html_content = net.generate_html()
+        
+        # Add info overlay and legend
+        n_nodes, n_edges = len(net.nodes), len(net.edges)
+        if collapsed:
+            graph_stats = f"Communities: {n_nodes} ({G.number_of_nodes()} nodes) | Edges: {n_edges} | Double-click a community to expand it"
+        elif expand is not None:
+            graph_stats = f"Community {expand} | Nodes: {n_nodes} | Edges: {n_edges} | <a href=\"?\">Back to all communities</a>"
+        else:
+            graph_stats = f"Nodes: {n_nodes} | Edges: {n_edges}"
+        
+        # Splice the styling and overlays in with a single join instead of
+        # rewriting the whole page once per insertion
+        head_part, body_tag, body_rest = html_content.partition('<body>')
+        before_head, head_tag, head_rest = head_part.partition('<head>')
+        parts = [before_head, head_tag]
+        if head_tag:
+            parts.append(GRAPH_STYLE_BLOCK)
+        parts.extend([head_rest, body_tag])
+        if body_tag:
+            parts.append(f'''
+            <div class="graph-info">{graph_stats}</div>
+            {"" if collapsed else GRAPH_LEGEND_HTML}''')
+        if collapsed:
+            # The expand handler needs the network object, so it goes at the end of the body
+            body_content, body_close_tag, page_tail = body_rest.rpartition('</body>')
+            parts.extend([body_content, GRAPH_COMMUNITY_EXPAND_SCRIPT, body_close_tag, page_tail])
+        else:
+            parts.append(body_rest)
+        enhanced_html = ''.join(parts)
+        
+        logger.info(f"Generated interactive graph HTML for notebook {notebook_id}: {n_nodes} nodes, {n_edges} edges")
+        
+        return enhanced_html
+
     @app.get("/notebooks/{notebook_id}/graph/html")
-    async def get_notebook_graph_html(notebook_id: str):
+    async def get_notebook_graph_html(
+        notebook_id: str,
+        expand: Optional[int] = Query(None, description="Community to show in full when a large graph is collapsed")
+    ):
         """Generate interactive HTML graph visualization using pyvis and networkx"""
         validate_notebook_exists(notebook_id)
         
+        if not GRAPH_VIZ_AVAILABLE:
+            raise HTTPException(status_code=503, detail="Graph visualization dependencies (networkx, pyvis) unavailable")
+        
         try:
             # Path to the GraphML file created by LightRAG
             working_dir = LIGHTRAG_STORAGE_PATH / notebook_id
-            graphml_file = working_dir / "graph_chunk_entity_relation.graphml"
+            graphml_file = working_dir / GRAPHML_FILENAME
             
-            if not graphml_file.exists():
+            graphml_stat = get_graphml_stat(graphml_file)
+            if graphml_stat is None:
                 # Return a simple HTML page indicating no data
                 html_content = """
                 <!DOCTYPE html>
@@ -2252,313 +3546,51 @@ if LIGHTRAG_AVAILABLE:
                 """
                 return HTMLResponse(content=html_content)
             
-            # Install required packages if not available
-            try:
-                import networkx as nx
-                from pyvis.network import Network
-            except ImportError:
-                # Try to install packages
-                import subprocess
-                import sys
-                
-                logger.info("Installing required packages for graph visualization...")
-                try:
-                    subprocess.check_call([sys.executable, "-m", "pip", "install", "pyvis", "networkx"])
-                    import networkx as nx
-                    from pyvis.network import Network
-                    logger.info("Successfully installed pyvis and networkx")
-                except Exception as install_error:
-                    logger.error(f"Failed to install required packages: {install_error}")
-                    raise HTTPException(status_code=500, detail="Required packages (pyvis, networkx) not available")
-            
-            import random
-            import tempfile
-            
-            # Load the GraphML file
-            logger.info(f"Loading GraphML file: {graphml_file}")
-            G = nx.read_graphml(str(graphml_file))
-            
-            # Create a Pyvis network with responsive design
-            net = Network(
-                height="100vh",
-                width="100%",
-                bgcolor="#ffffff",
-                font_color="#333333",
-                notebook=False
-            )
-            
-            # Configure physics for better layout
-            net.set_options("""
-            var options = {
-              "physics": {
-                "enabled": true,
-                "stabilization": {"iterations": 100},
-                "barnesHut": {
-                  "gravitationalConstant": -8000,
-                  "centralGravity": 0.3,
-                  "springLength": 95,
-                  "springConstant": 0.04,
-                  "damping": 0.09
-                }
-              },
-              "nodes": {
-                "font": {"size": 12},
-                "scaling": {
-                  "min": 10,
-                  "max": 30
-                }
-              },
-              "edges": {
-                "font": {"size": 10},
-                "scaling": {
-                  "min": 1,
-                  "max": 3
-                }
-              }
-            }
-            """)
-            
-            # Convert NetworkX graph to Pyvis network
-            net.from_nx(G)
-            
-            # Define colors for different node types
-            node_type_colors = {
-                'person': '#FF6B6B',      # Red
-                'organization': '#4ECDC4', # Teal
-                'location': '#45B7D1',    # Blue
-                'concept': '#96CEB4',     # Green
-                'event': '#FFEAA7',      # Yellow
-                'entity': '#DDA0DD',     # Plum
-                'default': '#95A5A6'     # Gray
-            }
-            
-            # Enhance nodes with colors, titles, and better styling
-            for node in net.nodes:
-                # Determine node type from the data
-                node_type = 'entity'  # default
-                if 'entity_type' in node:
-                    node_type = str(node['entity_type']).lower()
-                elif 'type' in node:
-                    node_type = str(node['type']).lower()
-                
-                # Set color based on type
-                node["color"] = node_type_colors.get(node_type, node_type_colors['default'])
-                
-                # Add hover title with description
-                title_parts = [f"ID: {node.get('id', 'Unknown')}"]
-                if 'label' in node and node['label']:
-                    title_parts.append(f"Label: {node['label']}")
-                if node_type:
-                    title_parts.append(f"Type: {node_type.title()}")
-                if 'description' in node and node['description']:
-                    desc = str(node['description'])[:200] + "..." if len(str(node['description'])) > 200 else str(node['description'])
-                    title_parts.append(f"Description: {desc}")
-                
-                node["title"] = "\\n".join(title_parts)
-                
-                # Set node size based on connections (degree)
-                if hasattr(G, 'degree'):
-                    degree = G.degree(node['id']) if node['id'] in G else 1
-                    node["size"] = min(10 + degree * 2, 30)  # Size between 10-30
-                
-                # Clean up label for display
-                if 'label' in node and node['label']:
-                    # Truncate long labels
-                    label = str(node['label'])
-                    node["label"] = label[:20] + "..." if len(label) > 20 else label
-                else:
-                    # Use ID as label if no label exists
-                    node_id = str(node.get('id', ''))
-                    node["label"] = node_id[:20] + "..." if len(node_id) > 20 else node_id
+            # Serve the previously rendered page if the GraphML file hasn't changed
+            cache_entry = get_graph_cache_entry(graphml_file, graphml_stat.st_mtime)
+            loop = asyncio.get_running_loop()
             
-            # Enhance edges with titles and styling
-            for edge in net.edges:
-                title_parts = []
-                
-                # Add relationship type
-                if 'relationship' in edge and edge['relationship']:
-                    title_parts.append(f"Relationship: {edge['relationship']}")
-                elif 'relation_type' in edge and edge['relation_type']:
-                    title_parts.append(f"Relationship: {edge['relation_type']}")
-                
-                # Add weight if available
-                if 'weight' in edge and edge['weight']:
-                    try:
-                        weight = float(edge['weight'])
-                        title_parts.append(f"Weight: {weight:.2f}")
-                        # Set edge width based on weight
-                        edge["width"] = min(max(1, weight * 2), 5)
-                    except (ValueError, TypeError):
-                        pass
-                
-                # Add description if available
-                if 'description' in edge and edge['description']:
-                    desc = str(edge['description'])[:100] + "..." if len(str(edge['description'])) > 100 else str(edge['description'])
-                    title_parts.append(f"Description: {desc}")
-                
-                if title_parts:
-                    edge["title"] = "\\n".join(title_parts)
-                
-                # Style edges
-                edge["color"] = {"color": "#848484", "highlight": "#333333"}
+            # Expanded communities are cached in memory only, per GraphML version
+            if expand is not None:
+                community_html = cache_entry.setdefault("community_html", {})
+                if expand not in community_html:
+                    community_html[expand] = await loop.run_in_executor(
+                        GRAPH_EXECUTOR, build_graph_html, notebook_id, graphml_file, cache_entry, expand
+                    )
+                return HTMLResponse(content=community_html[expand])
             
-            # Generate HTML
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False) as tmp_file:
-                net.save_graph(tmp_file.name)
-                tmp_file.flush()
-                
-                # Read the generated HTML
-                with open(tmp_file.name, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
-                
-                # Clean up temp file
-                import os
-                os.unlink(tmp_file.name)
-            
-            # Enhance the HTML with custom styling and dark mode support
-            enhanced_html = html_content.replace(
-                '<head>',
-                '''<head>
-                <style>
-                    body { 
-                        margin: 0; 
-                        padding: 0; 
-                        font-family: Arial, sans-serif;
-                        background: #f8f9fa;
-                    }
-                    
-                    @media (prefers-color-scheme: dark) {
-                        body { background: #1a1a1a; }
-                    }
-                    
-                    .graph-container {
-                        position: relative;
-                        width: 100%;
-                        height: 100vh;
-                    }
-                    
-                    .graph-info {
-                        position: absolute;
-                        top: 10px;
-                        left: 10px;
-                        background: rgba(255, 255, 255, 0.9);
-                        padding: 10px;
-                        border-radius: 5px;
-                        font-size: 12px;
-                        z-index: 1000;
-                        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-                    }
-                    
-                    @media (prefers-color-scheme: dark) {
-                        .graph-info { 
-                            background: rgba(30, 30, 30, 0.9); 
-                            color: white;
-                        }
-                    }
-                    
-                    .legend {
-                        position: absolute;
-                        top: 10px;
-                        right: 10px;
-                        background: rgba(255, 255, 255, 0.9);
-                        padding: 10px;
-                        border-radius: 5px;
-                        font-size: 11px;
-                        z-index: 1000;
-                        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-                        max-width: 200px;
-                    }
-                    
-                    @media (prefers-color-scheme: dark) {
-                        .legend { 
-                            background: rgba(30, 30, 30, 0.9); 
-                            color: white;
-                        }
-                    }
-                    
-                    .legend-item {
-                        display: flex;
-                        align-items: center;
-                        margin: 2px 0;
-                    }
-                    
-                    .legend-color {
-                        width: 12px;
-                        height: 12px;
-                        border-radius: 50%;
-                        margin-right: 5px;
-                    }
-                </style>'''
-            )
+            if "html" not in cache_entry:
+                cached_html = read_cached_graph_html(working_dir, cache_entry["mtime"])
+                if cached_html is not None:
+                    cache_entry["html"] = cached_html
+            if "html" in cache_entry:
+                return HTMLResponse(content=cache_entry["html"])
             
-            # Add info overlay and legend
-            graph_stats = f"Nodes: {len(net.nodes)} | Edges: {len(net.edges)}"
-            
-            legend_html = '''
-            <div class="legend">
-                <strong>Node Types:</strong>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #FF6B6B;"></div>
-                    <span>Person</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #4ECDC4;"></div>
-                    <span>Organization</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #45B7D1;"></div>
-                    <span>Location</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #96CEB4;"></div>
-                    <span>Concept</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #FFEAA7;"></div>
-                    <span>Event</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #DDA0DD;"></div>
-                    <span>Entity</span>
-                </div>
-            </div>
-            '''
-            
-            enhanced_html = enhanced_html.replace(
-                '<body>',
-                f'''<body>
-                <div class="graph-info">{graph_stats}</div>
-                {legend_html}'''
-            )
+            # Render the page off the event loop
+            enhanced_html = await loop.run_in_executor(GRAPH_EXECUTOR, build_graph_html, notebook_id, graphml_file, cache_entry)
             
-            logger.info(f"Generated interactive graph HTML for notebook {notebook_id}: {len(net.nodes)} nodes, {len(net.edges)} edges")
+            cache_entry["html"] = enhanced_html
+            write_cached_graph_html(working_dir, cache_entry["mtime"], enhanced_html)
             
             return HTMLResponse(content=enhanced_html)
             
         except Exception as e:
-            logger.error(f"Error generating graph HTML for notebook {notebook_id}: {e}")
-            logger.error(f"Full traceback: {traceback.format_exc()}")
-            
-            # Return error HTML page
-            error_html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Knowledge Graph - Error</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; text-align: center; padding: 50px; }}
-                    .error {{ color: #d32f2f; font-size: 18px; }}
-                    .details {{ color: #666; font-size: 14px; margin-top: 10px; }}
-                </style>
-            </head>
-            <body>
-                <h2>Knowledge Graph</h2>
-                <p class="error">Error generating graph visualization</p>
-                <p class="details">{str(e)}</p>
-            </body>
-            </html>
-            """
-            return HTMLResponse(content=error_html)
+            logger.exception(f"Error generating graph HTML for notebook {notebook_id}: {e}")
+            
+            # Return error HTML page (escaping the message so it can't inject markup)
+            return HTMLResponse(content=GRAPH_ERROR_HTML_TEMPLATE.substitute(error=html.escape(str(e))))
+
+    DEBUG_MAX_LISTED_FILES = 200
+
+    def list_storage_files(directory: Path, limit: int = DEBUG_MAX_LISTED_FILES) -> List[str]:
+        """List up to limit entry names in a directory with a single scandir pass (no per-entry stat)"""
+        names = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if len(names) >= limit:
+                    break
+                names.append(entry.name)
+        return names
 
     @app.get("/notebooks/{notebook_id}/debug")
     async def debug_notebook_documents(notebook_id: str):
@@ -2567,21 +3599,19 @@ if LIGHTRAG_AVAILABLE:
         
         try:
             # Get all documents for this notebook
-            notebook_documents = [
-                doc for doc in lightrag_documents_db.values() 
-                if doc["notebook_id"] == notebook_id
-            ]
+            notebook_documents = get_notebook_documents(notebook_id)
             
             # Get LightRAG instance info
             rag_info = {"exists": False, "working_dir": None}
             if notebook_id in lightrag_instances:
                 rag = lightrag_instances[notebook_id]
                 working_dir = LIGHTRAG_STORAGE_PATH / notebook_id
+                directory_exists = working_dir.exists()
                 rag_info = {
                     "exists": True,
                     "working_dir": str(working_dir),
-                    "directory_exists": working_dir.exists(),
-                    "files": list(working_dir.glob("*")) if working_dir.exists() else []
+                    "directory_exists": directory_exists,
+                    "files": list_storage_files(working_dir) if directory_exists else []
                 }
             
             return {
@@ -2594,7 +3624,7 @@ if LIGHTRAG_AVAILABLE:
                         "status": doc["status"],
                         "lightrag_id": doc.get("lightrag_id"),
                         "error": doc.get("error"),
-                        "uploaded_at": doc["uploaded_at"].isoformat() if isinstance(doc["uploaded_at"], datetime) else doc["uploaded_at"]
+                        "uploaded_at": doc["uploaded_at"]
                     }
                     for doc in notebook_documents
                 ],
@@ -2612,6 +3642,12 @@ if LIGHTRAG_AVAILABLE:
         validate_notebook_exists(notebook_id)
         
         messages = chat_history_db.get(notebook_id, [])
+        offset = chat_history_offsets.get(notebook_id, 0)
+        
+        # Older messages beyond the in-memory window are read back from disk
+        if offset and (limit <= 0 or limit > len(messages)):
+            count = offset if limit <= 0 else limit - len(messages)
+            messages = await asyncio.to_thread(load_older_chat_messages, notebook_id, offset, count) + messages
         
         # Limit messages and convert to ChatMessage objects
         limited_messages = messages[-limit:] if limit > 0 else messages
@@ -2620,7 +3656,7 @@ if LIGHTRAG_AVAILABLE:
         return ChatHistoryResponse(
             notebook_id=notebook_id,
             messages=chat_messages,
-            total_messages=len(messages)
+            total_messages=get_chat_history_total(notebook_id)
         )
 
     @app.delete("/notebooks/{notebook_id}/chat/history")
@@ -2629,8 +3665,7 @@ if LIGHTRAG_AVAILABLE:
         validate_notebook_exists(notebook_id)
         
         if notebook_id in chat_history_db:
-            del chat_history_db[notebook_id]
-            save_chat_history_db()
+            clear_notebook_chat_history(notebook_id)
         
         return {"message": "Chat history cleared successfully"}
 
@@ -2685,7 +3720,7 @@ if LIGHTRAG_AVAILABLE:
                 top_k=query.top_k
             )
             
-            result = await rag.aquery(enhanced_question, param=query_param)
+            result = await run_rag_query(rag, enhanced_question, query_param)
             
             # Extract citations (basic implementation)
             citations = []
@@ -2705,7 +3740,7 @@ if LIGHTRAG_AVAILABLE:
             chat_history_db[notebook_id].append(assistant_message)
             
             # Save chat history
-            save_chat_history_db()
+            save_chat_history_db(notebook_id)
             
             return NotebookQueryResponse(
                 answer=str(result),
@@ -2716,9 +3751,10 @@ if LIGHTRAG_AVAILABLE:
                 chat_context_used=bool(chat_context)
             )
             
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error in chat query for notebook {notebook_id}: {e}")
-            logger.error(f"Full error traceback: {traceback.format_exc()}")
+            logger.exception(f"Error in chat query for notebook {notebook_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error processing chat query: {str(e)}")
 
     # Document Summary Endpoints
@@ -2729,10 +3765,7 @@ if LIGHTRAG_AVAILABLE:
         
         try:
             # Get document list
-            notebook_documents = [
-                doc for doc in lightrag_documents_db.values() 
-                if doc["notebook_id"] == notebook_id and doc["status"] == "completed"
-            ]
+            notebook_documents = get_notebook_documents(notebook_id, status="completed")
             
             if not notebook_documents:
                 return NotebookQueryResponse(
@@ -2744,6 +3777,20 @@ if LIGHTRAG_AVAILABLE:
                     chat_context_used=False
                 )
             
+            # Collect per-document details in a single pass over the snapshot
+            filenames = []
+            citations = []
+            source_docs = []
+            for doc in notebook_documents:
+                filenames.append(doc["filename"])
+                citations.append({"source": doc["filename"], "type": "document"})
+                if request.include_details:
+                    source_docs.append({
+                        "filename": doc["filename"],
+                        "upload_date": doc["uploaded_at"],
+                        "status": doc["status"]
+                    })
+            
             # Get LightRAG instance
             rag = await get_lightrag_instance(notebook_id)
             
@@ -2757,32 +3804,24 @@ if LIGHTRAG_AVAILABLE:
             summary_prompt = length_prompts.get(request.max_length, length_prompts["medium"])
             
             if request.include_details:
-                summary_prompt += f"\n\nInclude insights from these {len(notebook_documents)} documents: " + \
-                                ", ".join([doc["filename"] for doc in notebook_documents])
+                summary_prompt += f"\n\nInclude insights from these {len(filenames)} documents: " + \
+                                ", ".join(filenames)
             
             # Execute summary query
             query_param = QueryParam(mode="hybrid", response_type="Multiple Paragraphs", top_k=100)
-            result = await rag.aquery(summary_prompt, param=query_param)
-            
-            # Build source documents list
-            source_docs = []
-            if request.include_details:
-                for doc in notebook_documents:
-                    source_docs.append({
-                        "filename": doc["filename"],
-                        "upload_date": doc["uploaded_at"].isoformat() if isinstance(doc["uploaded_at"], datetime) else doc["uploaded_at"],
-                        "status": doc["status"]
-                    })
+            result = await run_rag_query(rag, summary_prompt, query_param)
             
             return NotebookQueryResponse(
                 answer=str(result),
                 mode="hybrid",
                 context_used=True,
-                citations=[{"source": doc["filename"], "type": "document"} for doc in notebook_documents],
+                citations=citations,
                 source_documents=source_docs,
                 chat_context_used=False
             )
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error generating detailed summary for notebook {notebook_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
@@ -2937,7 +3976,8 @@ async def extract_document_text(file: UploadFile = File(...)):
         extracted_text = await extract_text_from_file(file.filename, file_content)
         
         # Get file statistics
-        file_extension = file.filename.lower().split('.')[-1] if '.' in file.filename else 'unknown'
+        _, dot, file_extension = file.filename.rpartition('.')
+        file_extension = file_extension.lower() if dot else 'unknown'
         text_length = len(extracted_text)
         word_count = len(extracted_text.split()) if extracted_text else 0
         
@@ -2959,13 +3999,17 @@ async def extract_document_text(file: UploadFile = File(...)):
         # Re-raise HTTP exceptions (like unsupported file types)
         raise
     except Exception as e:
-        logger.error(f"Error extracting text from {file.filename}: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"Error extracting text from {file.filename}: {e}")
         raise HTTPException(
             status_code=500, 
             detail=f"Error processing document: {str(e)}"
         )
 
+# Audio uploads are spooled to disk in chunks of this size
+AUDIO_UPLOAD_CHUNK_SIZE = 1024 * 1024
+SUPPORTED_AUDIO_FORMATS = frozenset({'mp3', 'wav', 'flac', 'm4a', 'ogg', 'opus'})
+SUPPORTED_AUDIO_FORMATS_MSG = ', '.join(sorted(SUPPORTED_AUDIO_FORMATS))
+
 # Audio transcription endpoint
 @app.post("/transcribe")
 async def transcribe_audio(
@@ -2976,53 +4020,65 @@ async def transcribe_audio(
 ):
     """Transcribe an audio file using faster-whisper (CPU mode)"""
     # Validate file extension
-    supported_formats = ['mp3', 'wav', 'flac', 'm4a', 'ogg', 'opus']
-    
     if not file.filename:
         raise HTTPException(status_code=400, detail="No filename provided")
     
-    file_extension = file.filename.lower().split('.')[-1]
+    file_extension = file.filename.rsplit('.', 1)[-1].lower()
     
-    if file_extension not in supported_formats:
+    if file_extension not in SUPPORTED_AUDIO_FORMATS:
         raise HTTPException(
             status_code=400, 
-            detail=f"Unsupported audio format: {file_extension}. Supported formats: {', '.join(supported_formats)}"
+            detail=f"Unsupported audio format: {file_extension}. Supported formats: {SUPPORTED_AUDIO_FORMATS_MSG}"
         )
     
-    # Read file content
+    # Spool the upload to a temp file in chunks so large files never sit in memory whole
+    temp_audio_path = None
     try:
-        content = await file.read()
-        if not content:
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_audio:
+                temp_audio_path = temp_audio.name
+                bytes_written = 0
+                while chunk := await file.read(AUDIO_UPLOAD_CHUNK_SIZE):
+                    temp_audio.write(chunk)
+                    bytes_written += len(chunk)
+        except Exception as e:
+            logger.error(f"Error reading audio file: {e}")
+            raise HTTPException(status_code=500, detail=f"Error reading audio file: {str(e)}")
+        
+        if not bytes_written:
             raise HTTPException(status_code=400, detail="Empty audio file")
-    except Exception as e:
-        logger.error(f"Error reading audio file: {e}")
-        raise HTTPException(status_code=500, detail=f"Error reading audio file: {str(e)}")
-    
-    # Get Speech2Text instance
-    try:
-        s2t = get_speech2text()
-    except Exception as e:
-        logger.error(f"Error initializing Speech2Text: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to initialize Speech2Text: {str(e)}")
-    
-    # Transcribe the audio
-    try:
-        result = s2t.transcribe_bytes(
-            content,
-            language=language,
-            beam_size=beam_size,
-            initial_prompt=initial_prompt
-        )
         
-        return {
-            "status": "success",
-            "filename": file.filename,
-            "transcription": result
-        }
-    except Exception as e:
-        logger.error(f"Error transcribing audio: {e}")
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Error transcribing audio: {str(e)}")
+        # Get Speech2Text instance
+        try:
+            s2t = await run_in_threadpool(get_speech2text)
+        except Exception as e:
+            logger.error(f"Error initializing Speech2Text: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to initialize Speech2Text: {str(e)}")
+        
+        # Transcribe the audio straight from the spooled file
+        try:
+            result = await run_in_threadpool(
+                s2t.transcribe_file,
+                temp_audio_path,
+                language=language,
+                beam_size=beam_size,
+                initial_prompt=initial_prompt
+            )
+            
+            return {
+                "status": "success",
+                "filename": file.filename,
+                "transcription": result
+            }
+        except Exception as e:
+            logger.exception(f"Error transcribing audio: {e}")
+            raise HTTPException(status_code=500, detail=f"Error transcribing audio: {str(e)}")
+    finally:
+        if temp_audio_path:
+            try:
+                os.unlink(temp_audio_path)
+            except OSError:
+                pass
 
 # Text-to-Speech endpoints
 @app.post("/synthesize")
@@ -3035,21 +4091,22 @@ async def synthesize_text(request: TTSRequest):
         logger.info(f"TTS request: text='{request.text[:50]}...', engine={request.engine}, voice={request.voice}, speed={request.speed}")
         
         # Get Text2Speech instance
-        t2s = get_text2speech()
+        t2s = await run_in_threadpool(get_text2speech)
         
         # If specific engine requested, create new instance with those settings
         if request.engine and request.engine != t2s.engine:
-            logger.info(f"Creating new TTS instance with engine: {request.engine}")
-            t2s = Text2Speech(
-                engine=request.engine,
-                language=request.language or "en",
-                slow=request.slow or False,
-                voice=request.voice or "af_sarah",
-                speed=request.speed or 1.0
+            # Building a model on a cache miss takes seconds; keep it off the event loop
+            t2s = await run_in_threadpool(
+                get_text2speech_for,
+                request.engine,
+                request.language or "en",
+                bool(request.slow),
+                request.voice or "af_sarah",
+                request.speed or 1.0
             )
         
         # Generate speech
-        audio_bytes = t2s.synthesize_to_bytes(request.text)
+        audio_bytes = await run_in_threadpool(run_tts, t2s.synthesize_to_bytes, request.text)
         
         # Determine content type based on engine
         if request.engine in ["kokoro", "kokoro-onnx"]:
@@ -3066,10 +4123,17 @@ async def synthesize_text(request: TTSRequest):
         )
         
     except Exception as e:
-        logger.error(f"Error in TTS synthesis: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"Error in TTS synthesis: {e}")
         raise HTTPException(status_code=500, detail=f"TTS synthesis failed: {str(e)}")
 
+def remove_temp_files(*paths: str):
+    """Remove temporary files, ignoring any that are already gone"""
+    for path in set(paths):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
 @app.post("/synthesize/file")
 async def synthesize_text_to_file(
     text: str = Form(...),
@@ -3088,17 +4152,18 @@ async def synthesize_text_to_file(
         logger.info(f"TTS file request: text='{text[:50]}...', engine={engine}, voice={voice}, speed={speed}")
         
         # Get Text2Speech instance
-        t2s = get_text2speech()
+        t2s = await run_in_threadpool(get_text2speech)
         
         # If a specific engine is requested and different from current
         if engine and engine != t2s.engine:
-            logger.info(f"Creating new TTS instance with engine: {engine}")
-            t2s = Text2Speech(
-                engine=engine,
-                language=language or "en",
-                slow=slow or False,
-                voice=voice or "af_sarah",
-                speed=speed or 1.0
+            # Building a model on a cache miss takes seconds; keep it off the event loop
+            t2s = await run_in_threadpool(
+                get_text2speech_for,
+                engine,
+                language or "en",
+                bool(slow),
+                voice or "af_sarah",
+                speed or 1.0
             )
         
         # Determine file extension based on engine
@@ -3121,38 +4186,29 @@ async def synthesize_text_to_file(
         
         try:
             # Generate speech to file
-            output_path = t2s.synthesize_to_file(text, temp_path)
-            
-            # Read the file
-            with open(output_path, 'rb') as f:
-                audio_data = f.read()
-            
-            return Response(
-                content=audio_data,
-                media_type=content_type,
-                headers={
-                    "Content-Disposition": f"attachment; filename={filename}",
-                    "Content-Length": str(len(audio_data))
-                }
-            )
-            
-        finally:
+            output_path = await run_in_threadpool(run_tts, t2s.synthesize_to_file, text, temp_path)
+        except Exception:
             # Clean up temp file
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+            remove_temp_files(temp_path)
+            raise
+        
+        # Stream the file from disk and clean up once the response has been sent
+        return FileResponse(
+            output_path,
+            media_type=content_type,
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+            background=BackgroundTask(remove_temp_files, temp_path, output_path)
+        )
         
     except Exception as e:
-        logger.error(f"Error in TTS file synthesis: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"Error in TTS file synthesis: {e}")
         raise HTTPException(status_code=500, detail=f"TTS file synthesis failed: {str(e)}")
 
 @app.get("/tts/languages")
 async def get_tts_languages():
     """Get available languages for text-to-speech"""
     try:
-        t2s = get_text2speech()
+        t2s = await run_in_threadpool(get_text2speech)
         languages = t2s.get_available_languages()
         
         return {
@@ -3168,7 +4224,7 @@ async def get_tts_languages():
 async def get_tts_status():
     """Get current TTS engine status and configuration"""
     try:
-        t2s = get_text2speech()
+        t2s = await run_in_threadpool(get_text2speech)
         
         return {
             "engine": t2s.engine,
@@ -3180,57 +4236,95 @@ async def get_tts_status():
         logger.error(f"Error getting TTS status: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting TTS status: {str(e)}")
 
+@lru_cache(maxsize=1)
+def get_pyttsx3_voices() -> Optional[List[Dict[str, Any]]]:
+    """Enumerate system pyttsx3 voices once; the list doesn't change while the server runs"""
+    try:
+        import pyttsx3
+        engine = pyttsx3.init()
+        try:
+            return [
+                {
+                    "id": voice.id,
+                    "name": voice.name,
+                    "languages": getattr(voice, 'languages', []),
+                    "gender": getattr(voice, 'gender', 'unknown')
+                }
+                for voice in engine.getProperty('voices') or []
+            ]
+        finally:
+            engine.stop()
+    except Exception:
+        return None
+
+@lru_cache(maxsize=1)
+def get_tts_voices_json() -> bytes:
+    """Build and serialize the TTS voices listing once; it doesn't change while the server runs"""
+    voices = {
+        "kokoro_voices": {
+            "af_sarah": "American Female - Sarah (warm, friendly)",
+            "af_nicole": "American Female - Nicole (professional)",
+            "af_sky": "American Female - Sky (energetic)",
+            "am_adam": "American Male - Adam (deep, authoritative)",
+            "am_michael": "American Male - Michael (casual)",
+            "bf_emma": "British Female - Emma (elegant)",
+            "bf_isabella": "British Female - Isabella (sophisticated)",
+            "bm_george": "British Male - George (distinguished)",
+            "bm_lewis": "British Male - Lewis (modern)"
+        },
+        "pyttsx3_voices": "System dependent - use /tts/status to see available voices",
+        "gtts_languages": [
+            "en", "es", "fr", "de", "it", "pt", "ru", "ja", "ko", "zh", "hi", "ar"
+        ]
+    }
+    
+    # Use the actual pyttsx3 voices if available
+    system_voices = get_pyttsx3_voices()
+    if system_voices:
+        voices["pyttsx3_voices"] = system_voices
+    
+    # Voice metadata from some system drivers contains bytes, so encode through FastAPI first
+    voices = jsonable_encoder(voices)
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(voices)
+    return json.dumps(voices).encode()
+
+# Built at startup; pyttsx3.init() blocks, so it runs on the threadpool before requests are served
+tts_voices_json: Optional[bytes] = None
+
+@app.on_event("startup")
+async def build_tts_voices_json():
+    global tts_voices_json
+    try:
+        tts_voices_json = await run_in_threadpool(get_tts_voices_json)
+    except Exception as e:
+        logger.warning(f"Could not build TTS voices listing at startup: {e}")
+
 @app.get("/tts/voices")
 async def get_tts_voices():
     """Get available voices for TTS engines"""
+    global tts_voices_json
     try:
-        voices = {
-            "kokoro_voices": {
-                "af_sarah": "American Female - Sarah (warm, friendly)",
-                "af_nicole": "American Female - Nicole (professional)",
-                "af_sky": "American Female - Sky (energetic)",
-                "am_adam": "American Male - Adam (deep, authoritative)",
-                "am_michael": "American Male - Michael (casual)",
-                "bf_emma": "British Female - Emma (elegant)",
-                "bf_isabella": "British Female - Isabella (sophisticated)",
-                "bm_george": "British Male - George (distinguished)",
-                "bm_lewis": "British Male - Lewis (modern)"
-            },
-            "pyttsx3_voices": "System dependent - use /tts/status to see available voices",
-            "gtts_languages": [
-                "en", "es", "fr", "de", "it", "pt", "ru", "ja", "ko", "zh", "hi", "ar"
-            ]
-        }
-        
-        # Try to get actual pyttsx3 voices if available
-        try:
-            import pyttsx3
-            engine = pyttsx3.init()
-            system_voices = engine.getProperty('voices')
-            if system_voices:
-                voices["pyttsx3_voices"] = [
-                    {
-                        "id": voice.id,
-                        "name": voice.name,
-                        "languages": getattr(voice, 'languages', []),
-                        "gender": getattr(voice, 'gender', 'unknown')
-                    }
-                    for voice in system_voices
-                ]
-            engine.stop()
-        except:
-            pass
-        
-        return voices
-        
+        # Only a failed startup build is retried here, still off the event loop
+        if tts_voices_json is None:
+            tts_voices_json = await run_in_threadpool(get_tts_voices_json)
+        return Response(content=tts_voices_json, media_type="application/json")
     except Exception as e:
         logger.error(f"Error getting TTS voices: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting TTS voices: {str(e)}")
 
+# Uvicorn server, set when run as a script so signals can ask it to shut down gracefully
+server = None
+
 # Handle graceful shutdown
 def handle_exit(signum, frame):
     logger.info(f"Received signal {signum}, shutting down gracefully")
-    sys.exit(0)
+    if server is not None:
+        # Let uvicorn finish in-flight requests and run shutdown hooks instead of
+        # raising SystemExit from inside the signal handler
+        server.should_exit = True
+    else:
+        sys.exit(0)
 
 # Register signal handlers
 signal.signal(signal.SIGINT, handle_exit)
@@ -3240,11 +4334,15 @@ if __name__ == "__main__":
     import uvicorn
     logger.info(f"Starting server on {HOST}:{PORT}")
     
-    # Start the server with reload=False to prevent duplicate processes
-    uvicorn.run(
-        "main:app",
+    # Start the server with reload=False to prevent duplicate processes. Loop and HTTP
+    # parser are left on "auto", which picks uvloop and httptools (uvicorn[standard])
+    # when installed. Stay on a single worker: notebook state lives in this process.
+    config = uvicorn.Config(
+        app,
         host=HOST,
         port=PORT,
         log_level="info",
         reload=False  # Change this to false to prevent multiple processes
     )
+    server = uvicorn.Server(config)
+    server.run()
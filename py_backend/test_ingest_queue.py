@@ -0,0 +1,72 @@
+import asyncio
+
+from ingest_queue import NotebookIngestQueue
+
+def test_other_notebook_starts_before_bulk_upload_finishes():
+    """A document for notebook B starts while notebook A still has documents waiting"""
+    async def scenario():
+        started = []
+        a_pending_when_b_started = []
+
+        async def process(notebook_id, document_id):
+            started.append(document_id)
+            if notebook_id == "B":
+                a_pending_when_b_started.append(queue.pending("A"))
+            await asyncio.sleep(0.01)
+
+        queue = NotebookIngestQueue(process, max_concurrent=2)
+        for i in range(6):
+            queue.put("A", f"a{i}")
+        queue.put("B", "b0")
+        while queue.pending() or queue._drains:
+            await asyncio.sleep(0.01)
+        return started, a_pending_when_b_started
+
+    started, a_pending_when_b_started = asyncio.run(scenario())
+    assert a_pending_when_b_started and a_pending_when_b_started[0] > 0
+    assert started.index("b0") < started.index("a5")
+
+def test_notebook_documents_run_one_at_a_time_in_order():
+    """Documents of the same notebook never overlap and keep upload order"""
+    async def scenario():
+        running = 0
+        max_running = 0
+        order = []
+
+        async def process(notebook_id, document_id):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            order.append(document_id)
+            await asyncio.sleep(0.005)
+            running -= 1
+
+        queue = NotebookIngestQueue(process, max_concurrent=4)
+        for i in range(5):
+            queue.put("A", f"a{i}")
+        while queue.pending() or queue._drains:
+            await asyncio.sleep(0.01)
+        return max_running, order
+
+    max_running, order = asyncio.run(scenario())
+    assert max_running == 1
+    assert order == [f"a{i}" for i in range(5)]
+
+def test_failed_document_does_not_stop_the_notebook():
+    """An exception from one document is logged and the next one still runs"""
+    async def scenario():
+        done = []
+
+        async def process(notebook_id, document_id):
+            if document_id == "a0":
+                raise RuntimeError("boom")
+            done.append(document_id)
+
+        queue = NotebookIngestQueue(process, max_concurrent=1)
+        queue.put("A", "a0")
+        queue.put("A", "a1")
+        while queue.pending() or queue._drains:
+            await asyncio.sleep(0.01)
+        return done
+
+    assert asyncio.run(scenario()) == ["a1"]